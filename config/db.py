@@ -1,5 +1,10 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 import os
+import time
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,8 +19,80 @@ if DATABASE_URL.startswith("postgres://"):
 if DATABASE_URL.startswith("postgresql://") and "+psycopg" not in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
 
+# Pool settings, per process (each uvicorn/transcription worker has its own pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# Logging every statement is for local debugging only, it is synchronous and slow
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+# Statements slower than this are logged, 0 turns the slow query log off
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "0"))
+
+
+def _install_slow_query_log(engine, threshold_ms: float):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+        if elapsed_ms >= threshold_ms:
+            print(f"Slow query ({elapsed_ms:.0f} ms): {' '.join(statement.split())[:500]}")
+
+
+def _engine_options(url: str) -> dict:
+    options = {
+        "echo": DB_ECHO,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_size"] = DB_POOL_SIZE
+        options["max_overflow"] = DB_MAX_OVERFLOW
+    return options
+
+
+def make_engine(url: str):
+    engine = create_engine(url, **_engine_options(url))
+    if DB_SLOW_QUERY_MS > 0:
+        _install_slow_query_log(engine, DB_SLOW_QUERY_MS)
+    return engine
+
+
+def _async_url(url: str) -> str:
+    # psycopg3 has a native async mode, SQLite needs the aiosqlite driver
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def make_async_engine(url: str) -> AsyncEngine:
+    url = _async_url(url)
+    options = _engine_options(url)
+    options.pop("connect_args", None)
+    engine = create_async_engine(url, **options)
+    if DB_SLOW_QUERY_MS > 0:
+        _install_slow_query_log(engine.sync_engine, DB_SLOW_QUERY_MS)
+    return engine
+
+
 # To create the SQLModel compatible engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = make_engine(DATABASE_URL)
+
+# Created on first use, so processes that never touch an async route don't open a pool
+_async_engine: Optional[AsyncEngine] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = make_async_engine(DATABASE_URL)
+    return _async_engine
 
 # # To create tables
 # def create_db_and_tables():
@@ -23,4 +100,10 @@ engine = create_engine(DATABASE_URL, echo=True)
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+# For async routes, DB I/O is awaited instead of blocking the event loop
+async def get_async_session():
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,36 @@
+import os
+import hashlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Settings that change what the pipeline produces for a given recording
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+# Voice activity pre-pass before Whisper: off, energy or silero (see utils/vad.py)
+TRANSCRIBE_VAD = os.getenv("TRANSCRIBE_VAD", "off").lower()
+
+# Bump when prompts or post-processing change so cached results are not reused
+PIPELINE_VERSION = "3"
+
+
+def pipeline_fingerprint() -> str:
+    raw = f"{PIPELINE_VERSION}|{WHISPER_MODEL}|{SUMMARY_MODEL}"
+    # Kept out of the key when off, so results cached before the setting existed stay valid
+    if TRANSCRIBE_VAD != "off":
+        raw += f"|vad={TRANSCRIBE_VAD}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+# Smaller/faster model for live (in-service) drafts over the WebSocket
+WHISPER_LIVE_MODEL = os.getenv("WHISPER_LIVE_MODEL") or WHISPER_MODEL
+
+# Whisper runtime settings, see utils/whisper_models.py
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")  # int8 for massive RAM savings
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))  # 0 lets CTranslate2 decide
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
+WHISPER_DOWNLOAD_ROOT = os.getenv("WHISPER_DOWNLOAD_ROOT", "./models")
+# Comma separated model names loaded at startup instead of on the first transcription
+WHISPER_PRELOAD = [m.strip() for m in os.getenv("WHISPER_PRELOAD", "").split(",") if m.strip()]
+# Models unused for this long are dropped to give the RAM back, 0 keeps them forever
+WHISPER_IDLE_SECONDS = int(os.getenv("WHISPER_IDLE_SECONDS", "0"))
@@ -1,12 +1,64 @@
-from fastapi import FastAPI
+import asyncio
+import hmac
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
 from routes import sermon
 from dotenv import load_dotenv
 from routes import auth
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from utils.job_queue import create_job_table, sweep_jobs, worker_metrics, JOB_SWEEP_INTERVAL
+from utils.otp_store import create_otp_table, sweep_otps
+from utils.usage import migrate_usage_table
+from models.sermon import create_sermon_indexes
+from config.db import engine
+from utils.email import start_email_sender, stop_email_sender
+from utils import metrics
+from config.pipeline import WHISPER_PRELOAD
 
 load_dotenv()
 
-app = FastAPI()
+# /metrics answers only with "Authorization: Bearer <METRICS_TOKEN>", unset turns it off
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+# To expire old jobs and OTP codes in the background, so both stores stay bounded
+async def _sweep_jobs_forever():
+    while True:
+        try:
+            swept = await run_in_threadpool(sweep_jobs)
+            if any(swept.values()):
+                print(f"Job store sweep: {swept}")
+        except Exception as e:
+            print(f"Job store sweep failed: {e}")
+        try:
+            await run_in_threadpool(sweep_otps)
+        except Exception as e:
+            print(f"OTP sweep failed: {e}")
+        await asyncio.sleep(JOB_SWEEP_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # To make sure the transcription job table exists before accepting uploads
+    create_job_table()
+    create_otp_table()
+    migrate_usage_table()
+    create_sermon_indexes(engine)
+    # Whisper is only loaded here when asked to (WHISPER_PRELOAD), otherwise on first use
+    if WHISPER_PRELOAD:
+        from utils.whisper_models import preload
+        await run_in_threadpool(preload, WHISPER_PRELOAD)
+    sweeper = asyncio.create_task(_sweep_jobs_forever())
+    # Emails are queued by the routes and sent from here
+    await start_email_sender()
+    yield
+    sweeper.cancel()
+    await stop_email_sender()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,3 +84,13 @@ def root():
         "message": "Sermon Note AI is running",
     }
 
+
+
+@app.get("/metrics")
+def get_metrics(authorization: str = Header(default="")):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    # Transcription, summary, LLM and VAD numbers come from the worker processes
+    return {**metrics.snapshot(), "workers": metrics.merge(worker_metrics())}
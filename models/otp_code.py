@@ -0,0 +1,15 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+class OtpCode(SQLModel, table=True):
+    __tablename__ = "otp_codes"
+
+    # One row per email, it also carries the send rate limit window
+    email: str = Field(primary_key=True)
+    # HMAC of the code, None once used
+    code_hash: Optional[str] = Field(default=None)
+    expires_at: datetime = Field(index=True)
+    attempts: int = Field(default=0)
+    window_start: datetime
+    sends: int = Field(default=1)
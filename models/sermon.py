@@ -1,7 +1,8 @@
 from sqlmodel import SQLModel, Field
 from typing import Optional, List
 from datetime import datetime
-from sqlalchemy import Column
+from sqlalchemy import Column, Index, inspect
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.dialects.postgresql import JSONB
 
 class Sermon(SQLModel, table=True):
@@ -15,3 +16,15 @@ class Sermon(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+
+# For the per-user sermon list, newest first (keyset pagination on created_at, id)
+user_created_index = Index("ix_sermons_user_id_created_at", Sermon.user_id, Sermon.created_at.desc(), Sermon.id.desc())
+
+
+# The sermons table predates the index and is not created by the app, so the index is
+# added at startup. IF NOT EXISTS makes it safe from every process.
+def create_sermon_indexes(engine):
+    if not inspect(engine).has_table(Sermon.__tablename__):
+        return
+    with engine.begin() as conn:
+        conn.execute(CreateIndex(user_created_index, if_not_exists=True))
@@ -1,7 +1,7 @@
 from sqlmodel import SQLModel, Field
-from tying import Optional, Dict, Any
+from typing import Optional, Dict, Any
 from datetime import datetime
-from sqlalcehmy import Column
+from sqlalchemy import Column
 from sqlalchemy.dialects.postgresql import JSONB
 
 class SubscriptionPlan(SQLModel, table=True):
@@ -0,0 +1,52 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional, Dict, Any
+from datetime import datetime
+from enum import Enum
+from sqlalchemy import Column, JSON, Text
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    DONE = "done"
+    ERROR = "error"
+    # Result dropped after its TTL (or evicted), the row is kept so clients get a 410
+    EXPIRED = "expired"
+
+class TranscriptionJob(SQLModel, table=True):
+    __tablename__ = "transcription_jobs"
+
+    id: str = Field(primary_key=True)
+    status: JobStatus = Field(default=JobStatus.QUEUED, index=True)
+    file_path: str
+    # Who uploaded it, usage is metered per user
+    user_id: Optional[int] = Field(default=None, index=True)
+    # SHA-256 of the uploaded audio, key into the result cache
+    audio_hash: Optional[str] = Field(default=None, index=True)
+    # Length of the recording, probed at upload, drives scheduling and time estimates
+    duration_seconds: Optional[float] = Field(default=None)
+    # Plain JSON (not JSONB) so the queue also works on the local SQLite stand-in
+    result: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+    # Large results are written to a file under JOB_RESULT_DIR instead of the row
+    result_path: Optional[str] = Field(default=None)
+    # Latest progress reported by the worker, e.g. {"stage": "transcribing", "percent": 42.0}
+    progress: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = Field(default=None)
+    trace: Optional[str] = Field(default=None, sa_column=Column(Text))
+    worker_id: Optional[str] = Field(default=None)
+    attempts: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    started_at: Optional[datetime] = Field(default=None)
+    finished_at: Optional[datetime] = Field(default=None)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Last time a client fetched the finished job, for LRU eviction
+    accessed_at: Optional[datetime] = Field(default=None)
+
+
+# One row per running worker.py process, refreshed while it polls for jobs
+class TranscriptionWorker(SQLModel, table=True):
+    __tablename__ = "transcription_workers"
+
+    id: str = Field(primary_key=True)
+    seen_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    # The worker's utils.metrics export, so the API's /metrics can report it
+    metrics: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
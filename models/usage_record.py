@@ -12,7 +12,8 @@ class UsageRecord(SQLModel, table=True):
     )
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id", index=True)
-    subscription_id: int = Field(foreign_key="user_subscriptions.id", index=True)
+    # None for users on the free plan (no subscription row)
+    subscription_id: Optional[int] = Field(default=None, foreign_key="user_subscriptions.id", index=True)
     usage_month: date = Field(index=True)
     transcription_count: int = Field(default=0)
     transcription_duration_seconds: int = Field(default=0)
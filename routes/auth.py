@@ -1,24 +1,26 @@
 import random
 
 from fastapi import  APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import  Session, select
 from models.user import User
 from schemas.user import UserCreate, UserRead, UserLogin, TokenResponse, UpdateProfile, ChangePassword, ForgotPasswordRequest, ResetPasswordOTPRequest, ResetPasswordRequest
-from config.db import get_session
-from utils.security import hash_password, verify_password, generate_reset_token, hash_password, create_access_token
+from config.db import get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from utils.security import hash_password_async, verify_password_async, generate_reset_token, create_access_token
 from utils.token_store import reset_tokens
-from utils.otp_store import set_otp, verify_otp
+from utils.otp_store import set_otp, verify_otp, OTP_TTL_SECONDS
 from utils.email import send_email
 from datetime import datetime
-from utils.auth import get_current_user
+from utils.auth import get_current_user, invalidate_user
 
 
 router = APIRouter()
 
 @router.post("/signup", response_model=UserRead)
-def signup(user_data: UserCreate, session: Session = Depends(get_session)):
+async def signup(user_data: UserCreate, session: AsyncSession = Depends(get_async_session)):
     # To check if the user exists
-    existing_user = session.exec(select(User).where(User.email == user_data.email)).first()
+    existing_user = (await session.exec(select(User).where(User.email == user_data.email))).first()
 
     if existing_user:
         raise  HTTPException(
@@ -26,7 +28,7 @@ def signup(user_data: UserCreate, session: Session = Depends(get_session)):
             detail = "Email already registered"
         )
 
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = await hash_password_async(user_data.password)
     user = User(
         name = user_data.name,
         email = user_data.email,
@@ -34,14 +36,14 @@ def signup(user_data: UserCreate, session: Session = Depends(get_session)):
     )
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     return user
 
 @router.post("/login", response_model=TokenResponse)
-def login(user_data: UserLogin, session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.email == user_data.email)).first()
+async def login(user_data: UserLogin, session: AsyncSession = Depends(get_async_session)):
+    user = (await session.exec(select(User).where(User.email == user_data.email))).first()
 
     if not user:
         raise HTTPException(
@@ -49,7 +51,7 @@ def login(user_data: UserLogin, session: Session = Depends(get_session)):
             detail="User not found"
         )
 
-    if not verify_password(user_data.password, user.password):
+    if not await verify_password_async(user_data.password, user.password):
         raise HTTPException(
             status_code=401,
             detail="Incorrect password"
@@ -87,28 +89,38 @@ def update_profile(data: UpdateProfile, session: Session = Depends(get_session))
     session.add(user)
     session.commit()
     session.refresh(user)
+    invalidate_user(user.id)
 
     return user
 
 @router.put("/change-password", response_model=UserRead)
-def change_password(data: ChangePassword, session: Session = Depends(get_session)):
-    user = session.exec(select(User)).first()
+async def change_password(data: ChangePassword, session: AsyncSession = Depends(get_async_session)):
+    user = (await session.exec(select(User))).first()
 
-    if not verify_password(data.current_password, user.password):
+    if not await verify_password_async(data.current_password, user.password):
         raise HTTPException(
             status_code=400,
             detail="Incorrect current password"
         )
 
-    user.password = hash_password(data.new_password)
+    user.password = await hash_password_async(data.new_password)
     user.updated_at = datetime.utcnow()
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
+    invalidate_user(user.id)
 
     return user
 
+# "10 minutes" for the default OTP_TTL_SECONDS, seconds when it isn't whole minutes
+def _otp_lifetime() -> str:
+    if OTP_TTL_SECONDS % 60:
+        return f"{OTP_TTL_SECONDS} seconds"
+    minutes = OTP_TTL_SECONDS // 60
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
 @router.post("/forgot-password")
 def forgot_password(data: ForgotPasswordRequest, session: Session = Depends(get_session)):
     user = session.exec(select(User).where(User.email == data.email)).first()
@@ -119,12 +131,18 @@ def forgot_password(data: ForgotPasswordRequest, session: Session = Depends(get_
         )
 
     otp = str(random.randint(100000, 999999))
-    set_otp(data.email, otp)
+    retry_after = set_otp(data.email, otp)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many codes requested, please retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
 
     send_email(
         to = data.email,
         subject = "SERMON NOTE AI OTP Code",
-        html=f"<h2>Reset Password</h2><p>Your OTP is: <b>{otp}</b>. It expires in 10 minutes.</p>"
+        html=f"<h2>Reset Password</h2><p>Your OTP is: <b>{otp}</b>. It expires in {_otp_lifetime()}.</p>"
     )
 
     # token = generate_reset_token()
@@ -136,14 +154,15 @@ def forgot_password(data: ForgotPasswordRequest, session: Session = Depends(get_
     }
 
 @router.post("/reset-password-otp")
-def reset_password_otp(data: ResetPasswordOTPRequest, session: Session = Depends(get_session)):
-    if not verify_otp(data.email, data.otp):
+async def reset_password_otp(data: ResetPasswordOTPRequest, session: AsyncSession = Depends(get_async_session)):
+    # verify_otp is a DB transaction, kept off the event loop
+    if not await run_in_threadpool(verify_otp, data.email, data.otp):
         raise HTTPException(
             status_code=400,
             detail="Invalid or expired OTP"
         )
 
-    user = session.exec(select(User).where(User.email == data.email)).first()
+    user = (await session.exec(select(User).where(User.email == data.email))).first()
     if not user:
         raise HTTPException(
             status_code=400,
@@ -155,11 +174,12 @@ def reset_password_otp(data: ResetPasswordOTPRequest, session: Session = Depends
     if len(data.new_password.encode()) > 256:
         raise HTTPException(400, "Password too long")
 
-    user.password = hash_password(data.new_password)
+    user.password = await hash_password_async(data.new_password)
     user.updated_at = datetime.utcnow()
 
     session.add(user)
-    session.commit()
+    await session.commit()
+    invalidate_user(user.id)
 
     return {
         "message": "Password reset successful"
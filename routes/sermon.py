@@ -1,101 +1,332 @@
+import asyncio
+import json
 import tempfile
 import os
-import uuid
-import traceback
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Request, BackgroundTasks
-from fastapi.responses import JSONResponse, Response
+import hashlib
+import time
+from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Request, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from starlette import status
-from typing import Dict, Any
+from sqlalchemy import tuple_
 from sqlmodel import Session, select
+from typing import Optional, Tuple
 from models.sermon import Sermon
+from models.transcription_job import JobStatus
 from schemas.sermon import SermonCreate, SermonOutput, SermonUpdate
 from models.user import User
-from utils.auth import get_current_user
-from utils.transcribe import transcribe_audio, transcribe_file
-from utils.summarize import generate_summary
-from utils.extract_bible import detect_bible_verses
-from config.db import get_session
+from utils.auth import get_current_user, user_from_token
+from utils.job_queue import (
+    enqueue_job, record_cached_job, get_job, load_job_result, touch_job, queue_depth, cached_finish_at,
+    jobs_in_flight, workers_alive,
+    JOB_QUEUE_MAX_DEPTH, JOB_RETRY_AFTER_SECONDS, UPLOAD_DIR, JOB_FINISHED, JOB_MAX_AUDIO_SECONDS,
+)
+from utils.audio_info import probe_duration
+from utils.usage import Usage, quota_error, record_usage, seconds_left
+from utils.result_cache import get_cached_result
+from utils.pagination import encode_cursor, decode_cursor, etag_for, etag_matches
+from config.db import engine, get_session, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime
 
 router = APIRouter()
 
-# To set native in-memory job store (for a single render instance)
-JOBS: Dict[str, Dict[str, Any]] = {}
 
+def _check_quota(user_id: int, seconds: Optional[float]):
+    # Jobs still queued or running count too, a burst of uploads can't overshoot the plan
+    count, pending_seconds = jobs_in_flight(user_id)
+    return quota_error(user_id, seconds or 0, Usage(count, int(pending_seconds)))
 
-def _process_job(job_id: str, tmp_path: str):
-    try:
-        JOBS[job_id]["status"] = "processing"
-        # To transcribe
-        transcript = transcribe_file(tmp_path)
-        # To summarize and extract bible verses
-        summary = generate_summary(transcript)
-        joined = " ".join(summary)[:4000]  # To prevent sending huge text
-        bible_refs = detect_bible_verses(joined)
-        # If successful
-        JOBS[job_id].update({
-            "status": "done",
-            "result": {
-                "transcript": transcript,
-                "summary": summary,
-                "bible_references": bible_refs,
-            },
-            "error": None
-        })
 
-    except Exception as e:
-        # To record the error instead of throwing a 500
-        JOBS[job_id].update({
-            "status": "error",
-            "error": str(e),
-            "trace": traceback.format_exc(),
-            "result": None,
-        })
-    finally:
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
+def _live_seconds_left(user_id: int) -> Optional[float]:
+    count, pending_seconds = jobs_in_flight(user_id)
+    return seconds_left(user_id, Usage(count, int(pending_seconds)))
 
 
 @router.post("/transcribe", status_code=202)
-async def start_transcription(background: BackgroundTasks, file: UploadFile = File(...)):
-    # To save upload to a temp file & avoid to load all file into RAM
+async def start_transcription(
+    response: Response,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+):
+    # To save upload to a temp file & avoid to load all file into RAM,
+    # hashing it on the way for the result cache
     suffix = os.path.splitext(file.filename or ".m4a")[-1] or ".m4a"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+    sha = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=UPLOAD_DIR) as tmp:
         tmp_path = tmp.name
         while chunk := await file.read(1024 * 1024):
             tmp.write(chunk)
+            sha.update(chunk)
+    audio_hash = sha.hexdigest()
+
+    # To read the length from the file headers (no decoding), refuse over-long recordings.
+    # Without a length the limit, the quota and the scheduling can't work, so it's required.
+    duration = await run_in_threadpool(probe_duration, tmp_path)
+    if not duration:
+        os.remove(tmp_path)
+        raise HTTPException(
+            status_code=422,
+            detail="Could not read the length of the recording, please upload a valid audio file",
+        )
+    if duration > JOB_MAX_AUDIO_SECONDS:
+        os.remove(tmp_path)
+        raise HTTPException(
+            status_code=413,
+            detail=f"Recording is too long, the limit is {JOB_MAX_AUDIO_SECONDS / 60:.0f} minutes",
+        )
 
-    job_id = uuid.uuid4().hex
-    JOBS[job_id] = {"status": "queued", "result": None, "error": None}
+    # To enforce the monthly limits of the user's plan
+    quota = await run_in_threadpool(_check_quota, current_user.id, duration)
+    if quota:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=403, detail=quota)
+
+    # The same recording was already processed, answer right away. Metered like a
+    # worker cache hit: every delivered transcription counts against the plan
+    cached = await run_in_threadpool(get_cached_result, audio_hash)
+    if cached is not None:
+        os.remove(tmp_path)
+        job_id = await run_in_threadpool(record_cached_job, audio_hash, cached, duration, current_user.id)
+        await run_in_threadpool(record_usage, current_user.id, duration)
+        response.status_code = 200
+        return {"job_id": job_id, "status": JobStatus.DONE.value, **cached}
+
+    # Without a running worker.py the job would stay queued forever
+    if not await run_in_threadpool(workers_alive):
+        os.remove(tmp_path)
+        print("No transcription worker has checked in, is worker.py running?")
+        raise HTTPException(
+            status_code=503,
+            detail="Transcription is unavailable right now, please retry shortly",
+            headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)},
+        )
 
-    background.add_task(_process_job, job_id, tmp_path)
+    # To refuse new work when the workers are saturated
+    if await run_in_threadpool(queue_depth) >= JOB_QUEUE_MAX_DEPTH:
+        os.remove(tmp_path)
+        raise HTTPException(
+            status_code=429,
+            detail="Transcription queue is full, please retry shortly",
+            headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)},
+        )
 
-    # For client to poll GET /api/sermon/transcribe/{job_id}
+    # The job is persisted, a transcription worker (worker.py) picks it up
+    try:
+        job_id = await run_in_threadpool(enqueue_job, tmp_path, audio_hash, duration, current_user.id)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    # For client to follow GET /api/sermon/transcribe/{job_id}/events (SSE)
+    # or poll GET /api/sermon/transcribe/{job_id}?wait=30
     return {
         "job_id": job_id,
-        "status": "queued",
+        "status": JobStatus.QUEUED.value,
+        "duration_seconds": duration,
     }
 
-@router.get("/transcribe/{job_id}")
-def get_transcription(job_id: str):
-    job = JOBS.get(job_id)
+# Upper bound for ?wait= on the status endpoint, and how often a waiting request re-reads the job
+JOB_WAIT_MAX_SECONDS = int(os.getenv("JOB_WAIT_MAX_SECONDS", "60"))
+JOB_WATCH_INTERVAL = float(os.getenv("JOB_WATCH_INTERVAL", "1"))
+# Comment line sent on an idle event stream so proxies don't close it
+JOB_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+# No more changes will happen to a job in these states
+JOB_SETTLED = (*JOB_FINISHED, JobStatus.EXPIRED)
+
+
+def _job_state(job, finish_at: Optional[datetime] = None) -> Tuple[int, dict]:
+    if job.status == JobStatus.DONE:
+        return 200, {"status": "done", **job.result}
+
+    if job.status == JobStatus.ERROR:
+        return 500, {"status": "error", "error": job.error}
+
+    if job.status == JobStatus.EXPIRED:
+        return 410, {"status": "expired", "error": "Job result has expired, please transcribe again"}
+
+    # To start queue or processing
+    return 200, {
+        "status": job.status.value,
+        "progress": job.progress,
+        "duration_seconds": job.duration_seconds,
+        "estimated_finish_at": finish_at,
+    }
+
+
+def _fetch_job(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        return None, None
+    if job.status in JOB_FINISHED:
+        if job.status == JobStatus.DONE:
+            job.result = load_job_result(job)
+            # The spilled result file is gone, the job is as good as expired
+            if job.result is None:
+                job.status = JobStatus.EXPIRED
+                return job, None
+        touch_job(job_id)
+        return job, None
+    return job, cached_finish_at(job)
+
+
+async def _load_job(job_id: str):
+    job, finish_at = await run_in_threadpool(_fetch_job, job_id)
     if not job:
         raise HTTPException(404, "Job not found")
+    return job, finish_at
 
-    if job["status"] == "done":
-        return {"status": "done", **job["result"]}
 
-    if job["status"] == "error":
-        return JSONResponse(
-            status_code=500,
-            content={"status": "error", "error": job["error"]},
-        )
+@router.get("/transcribe/{job_id}")
+async def get_transcription(job_id: str, wait: int = Query(0, ge=0, le=JOB_WAIT_MAX_SECONDS)):
+    job, finish_at = await _load_job(job_id)
+
+    # Long-poll, with ?wait=30 the request is held until the job changes (or the wait is up)
+    deadline = time.monotonic() + wait
+    seen = job.updated_at
+    while job.status not in JOB_SETTLED and job.updated_at == seen and time.monotonic() < deadline:
+        await asyncio.sleep(min(JOB_WATCH_INTERVAL, max(0.0, deadline - time.monotonic())))
+        job, finish_at = await _load_job(job_id)
+
+    status_code, body = _job_state(job, finish_at)
+    if status_code != 200:
+        return JSONResponse(status_code=status_code, content=body)
+    return body
+
+
+@router.get("/transcribe/{job_id}/events")
+async def transcription_events(job_id: str, request: Request):
+    job, finish_at = await _load_job(job_id)
+
+    # Server-sent events, one "status" event per state or progress change. The stream ends
+    # after the done/error event, so a client needs one connection per job.
+    async def events():
+        current, current_finish_at = job, finish_at
+        last_sent = None
+        last_write = time.monotonic()
+        while True:
+            status_code, body = _job_state(current, current_finish_at)
+            data = json.dumps(jsonable_encoder(body))
+            if data != last_sent:
+                yield f"event: status\ndata: {data}\n\n"
+                last_sent = data
+                last_write = time.monotonic()
+            elif time.monotonic() - last_write >= JOB_EVENTS_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+
+            if current.status in JOB_SETTLED or await request.is_disconnected():
+                return
+            await asyncio.sleep(JOB_WATCH_INTERVAL)
+            current, current_finish_at = await run_in_threadpool(_fetch_job, job_id)
+            if current is None:
+                return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    # To start queue or processing
-    return {"status": job["status"]}
+# Containers a live session may send, passed to ffmpeg as the input format. Anything else
+# (hls, concat, ...) would let a client make ffmpeg open other files or URLs.
+LIVE_FORMATS = {"webm", "ogg", "mp4", "wav", "mp3"}
+# Live sessions run Whisper in this API process, each one holds a core while it's open
+LIVE_MAX_SESSIONS = int(os.getenv("LIVE_MAX_SESSIONS", "2"))
+_live_sessions = 0
+
+
+def _user_for_token(token: str) -> Optional[User]:
+    with Session(engine) as session:
+        return user_from_token(token, session)
+
+
+@router.websocket("/live")
+async def live_transcription(websocket: WebSocket, token: str = Query(...), format: str = "webm"):
+    if format not in LIVE_FORMATS:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason=f"Unsupported format {format}")
+        return
+    # Browsers can't set headers on a WebSocket, the access token comes as ?token=
+    user = await run_in_threadpool(_user_for_token, token)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    quota = await run_in_threadpool(_check_quota, user.id, 0)
+    if quota:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=quota)
+        return
+    global _live_sessions
+    if _live_sessions >= LIVE_MAX_SESSIONS:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many live sessions, please retry shortly")
+        return
+    _live_sessions += 1
+    try:
+        await _live_session(websocket, user, format)
+    finally:
+        _live_sessions -= 1
+
+
+async def _live_session(websocket: WebSocket, user: User, format: str):
+    # The recording is cut off once it uses up the month's minutes
+    allowance = await run_in_threadpool(_live_seconds_left, user.id)
+    await websocket.accept()
+
+    # Imported here so API processes that never serve a live session don't load Whisper
+    from utils.live import LiveTranscriber
+    from utils.summarize import generate_summary
+
+    live = LiveTranscriber(input_format=format)
+    await run_in_threadpool(live.start)
+    try:
+        # Binary frames are audio chunks, the text frame "stop" ends the recording
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                await run_in_threadpool(live.feed, message["bytes"])
+                if live.ready():
+                    for event in await run_in_threadpool(live.step):
+                        await websocket.send_json(event)
+                if allowance is not None and live.duration >= allowance:
+                    # Treated like "stop", the notes cover the audio up to the limit
+                    await websocket.send_json({"type": "limit", "error": "Monthly limit of audio minutes reached"})
+                    break
+            elif message.get("text") == "stop":
+                break
+
+        for event in await run_in_threadpool(live.finish):
+            await websocket.send_json(event)
+
+        # The transcript is already there, only the summary is left to do. Its bullets are
+        # pushed as the model writes them, the summary event then carries the final list.
+        loop = asyncio.get_running_loop()
+
+        def send_bullet(stage: str, part: int, bullet: str):
+            event = {"type": "summary_bullet", "stage": stage, "part": part, "bullet": bullet}
+            asyncio.run_coroutine_threadsafe(websocket.send_json(event), loop).result()
+
+        summary = await run_in_threadpool(generate_summary, live.transcript, on_bullet=send_bullet)
+        await websocket.send_json({
+            "type": "summary",
+            "transcript": live.transcript,
+            "summary": summary,
+            "bible_references": [ref["reference"] for ref in live.detector.references],
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    finally:
+        live.close()
+        # Segments went out as they were transcribed, so a session is metered however it
+        # ended, "stop", the limit or the client just closing the socket
+        if live.duration > 0:
+            await run_in_threadpool(record_usage, user.id, live.duration)
 
 
 @router.post("/save", response_model=SermonOutput)
@@ -125,34 +356,72 @@ def save_sermon(
         )
 
 
+# Columns the list view may ask for with ?fields=
+SERMON_LIST_FIELDS = {"id", "user_id", "title", "summary", "bible_references", "created_at", "updated_at"}
+SERMON_PAGE_MAX = 200
+
+
 @router.get("/all-sermons")
 def get_sermons(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=SERMON_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ):
-    sermons = (
-        session.query(Sermon)
-       .filter(Sermon.user_id == current_user.id)
-       .order_by(Sermon.created_at.desc())
-       .all()
+    # To load only the requested columns, e.g. ?fields=id,title,created_at for the list screen
+    wanted = [f.strip() for f in fields.split(",") if f.strip()] if fields else sorted(SERMON_LIST_FIELDS)
+    unknown = set(wanted) - SERMON_LIST_FIELDS
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    # id and created_at are always read, the next cursor is built from them
+    columns = list(dict.fromkeys(["id", "created_at", *wanted]))
+
+    query = (
+        select(*[getattr(Sermon, c) for c in columns])
+        .where(Sermon.user_id == current_user.id)
+        .order_by(Sermon.created_at.desc(), Sermon.id.desc())
     )
-    return sermons
+    # Keyset pagination, served by the (user_id, created_at, id) index
+    if cursor:
+        query = query.where(tuple_(Sermon.created_at, Sermon.id) < decode_cursor(cursor))
+    if limit:
+        query = query.limit(limit + 1)
+
+    rows = session.exec(query).all()
+    headers = {}
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    sermons = [{c: getattr(row, c) for c in wanted} for row in rows]
+
+    # Unchanged pages are answered with 304 and no body
+    headers["ETag"] = etag_for([sermons, headers.get("X-Next-Cursor")])
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse(content=jsonable_encoder(sermons), headers=headers)
 
 
 @router.patch("/{sermon_id}")
 async def update_sermon(
     sermon_id: int,
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user),
 ):
 
     payload = await request.json()
 
-    sermon = session.exec(select(Sermon).where(
+    sermon = (await session.exec(select(Sermon).where(
         Sermon.id == sermon_id,
         Sermon.user_id == current_user.id
-    )).first()
+    ))).first()
 
     if not sermon:
         raise HTTPException(
@@ -177,8 +446,8 @@ async def update_sermon(
 
     sermon.updated_at = datetime.utcnow()
     session.add(sermon)
-    session.commit()
-    session.refresh(sermon)
+    await session.commit()
+    await session.refresh(sermon)
 
     return sermon
 
@@ -0,0 +1,43 @@
+# Load test for GET /api/sermon/all-sermons against a running server.
+# Usage: python scripts/bench_all_sermons.py http://127.0.0.1:8000 <access_token> [requests] [concurrency]
+# Run it once with DB_ECHO=1 and once with the defaults to compare requests/sec.
+import asyncio
+import sys
+import time
+
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, url: str, headers: dict, count: int, latencies: list):
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def main(base_url: str, token: str, requests: int, concurrency: int):
+    url = f"{base_url.rstrip('/')}/api/sermon/all-sermons"
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies: list = []
+    async with httpx.AsyncClient(timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _worker(client, url, headers, requests // concurrency, latencies)
+            for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies)} requests in {elapsed:.2f}s -> {len(latencies) / elapsed:.1f} req/s")
+    print(f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        sys.argv[1],
+        sys.argv[2],
+        int(sys.argv[3]) if len(sys.argv) > 3 else 1000,
+        int(sys.argv[4]) if len(sys.argv) > 4 else 20,
+    ))
@@ -0,0 +1,65 @@
+# Authenticated requests/sec against a running server, alone and during a login burst.
+# Usage: python scripts/bench_auth.py http://127.0.0.1:8000 <email> <password> [requests] [concurrency] [logins]
+# Restart the server with AUTH_CACHE_SECONDS=0 to compare against uncached token checks.
+import asyncio
+import sys
+import time
+
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, url: str, headers: dict, count: int, latencies: list):
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def _login(client: httpx.AsyncClient, base_url: str, email: str, password: str) -> str:
+    response = await client.post(f"{base_url}/api/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _run(client, url, headers, requests, concurrency):
+    latencies: list = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(client, url, headers, requests // concurrency, latencies)
+        for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (
+        f"{len(latencies)} requests in {elapsed:.2f}s -> {len(latencies) / elapsed:.1f} req/s, "
+        f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms"
+    )
+
+
+async def main(base_url: str, email: str, password: str, requests: int, concurrency: int, logins: int):
+    base_url = base_url.rstrip("/")
+    url = f"{base_url}/api/auth/me"
+    async with httpx.AsyncClient(timeout=60) as client:
+        headers = {"Authorization": f"Bearer {await _login(client, base_url, email, password)}"}
+        print(f"authenticated: {await _run(client, url, headers, requests, concurrency)}")
+
+        # The same load while a burst of logins (bcrypt) runs
+        start = time.perf_counter()
+        burst = asyncio.gather(*(_login(client, base_url, email, password) for _ in range(logins)))
+        result = await _run(client, url, headers, requests, concurrency)
+        await burst
+        print(f"during {logins} logins: {result}")
+        print(f"logins finished in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        sys.argv[1],
+        sys.argv[2],
+        sys.argv[3],
+        int(sys.argv[4]) if len(sys.argv) > 4 else 1000,
+        int(sys.argv[5]) if len(sys.argv) > 5 else 20,
+        int(sys.argv[6]) if len(sys.argv) > 6 else 50,
+    ))
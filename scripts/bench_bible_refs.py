@@ -0,0 +1,57 @@
+# Compares the old per-call regex Bible reference detector with utils.bible_refs
+# on a full-length (about one hour) synthetic sermon transcript.
+# Usage: python scripts/bench_bible_refs.py [transcript.txt]
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.bible_refs import find_bible_references
+from utils.extract_bible import BIBLE_BOOKS
+
+
+def old_detect_bible_verses(transcript: str) -> list[str]:
+    # The previous implementation, the regex is rebuilt on every call
+    book_pattern = r"|".join(re.escape(book) for book in BIBLE_BOOKS)
+    pattern = rf"\b(?:{book_pattern})\s+\d{{1,3}}(?::\d{{1,3}}(?:-\d{{1,3}})?)?\b"
+    matches = re.findall(pattern, transcript, re.IGNORECASE)
+    return list(set(match.strip() for match in matches))
+
+
+def synthetic_transcript(words: int = 9000) -> str:
+    random.seed(7)
+    filler = ("the lord is good and his mercy endures forever so we give thanks "
+              "church family today we are looking at grace and faith").split()
+    refs = ["John 3:16", "Romans 8:28", "first Corinthians chapter thirteen verse four",
+            "Psalm 23", "Genesis 1:1-3", "Hebrews eleven one", "2 Tim 3:16"]
+    out = []
+    for i in range(words):
+        out.append(random.choice(filler))
+        if i % 300 == 0:
+            out.append(random.choice(refs))
+    return " ".join(out)
+
+
+def _time(fn, text: str, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn(text)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            text = f.read()
+    else:
+        text = synthetic_transcript()
+
+    runs = 20
+    old_ms = _time(old_detect_bible_verses, text, runs)
+    new_ms = _time(find_bible_references, text, runs)
+    print(f"{len(text)} chars, {runs} runs")
+    print(f"old regex:   {old_ms:.2f} ms/call, {len(old_detect_bible_verses(text))} refs")
+    print(f"bible_refs:  {new_ms:.2f} ms/call, {len(find_bible_references(text))} refs")
@@ -0,0 +1,84 @@
+# Compares the old fixed 3500-char chunking with token-based chunking: OpenAI calls per
+# sermon and total prompt tokens. Offline, no requests are made. Reduce calls are
+# estimated from partial summaries of PARTIAL_BULLETS bullets of BULLET_TOKENS tokens.
+# Each transcript is also run with its punctuation stripped, the sentence splitter then
+# falls back to word runs, and no chunk may go over SUMMARY_CHUNK_TOKENS.
+# Usage: python scripts/bench_chunking.py transcript.txt [more.txt ...]
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.summarize import (
+    REDUCE_BATCH_TOKENS, SUMMARY_CHUNK_TOKENS, _chunk_transcript, _group_by_tokens, map_messages, reduce_messages,
+)
+from utils.tokens import count_tokens
+
+PARTIAL_BULLETS = 8
+BULLET_TOKENS = 30
+
+
+# The splitter generate_summary used before: paragraphs/sentences packed up to 3500 chars
+def split_by_chars(text, max_chars=3500):
+    chunks, buf, current_len = [], [], 0
+    paragraphs = [p.strip() for p in re.sub(r"\r\n?", "\n", text).strip().split("\n") if p.strip()]
+    pieces = []
+    for p in paragraphs:
+        pieces.extend(re.split(r"(?<=[\.\!\?])\s+", p) if len(p) > max_chars else [p])
+    for piece in pieces:
+        if current_len + len(piece) + 1 > max_chars and buf:
+            chunks.append("\n".join(buf))
+            buf, current_len = [], 0
+        buf.append(piece)
+        current_len += len(piece) + 1
+    if buf:
+        chunks.append("\n".join(buf))
+    return chunks
+
+
+def prompt_tokens(messages):
+    return sum(count_tokens(m["content"]) for m in messages)
+
+
+def cost(chunks):
+    calls = len(chunks)
+    tokens = sum(prompt_tokens(map_messages(c, i, len(chunks))) for i, c in enumerate(chunks, start=1))
+
+    # The tree reduce over same sized partial lists
+    partial = "\n".join(f"- {'word ' * (BULLET_TOKENS - 1)}" for _ in range(PARTIAL_BULLETS))
+    level = [partial] * len(chunks)
+    while len(level) > 1:
+        batches = _group_by_tokens(level, max_tokens=REDUCE_BATCH_TOKENS, sep="\n\n", min_group=2)
+        calls += len(batches)
+        tokens += sum(prompt_tokens(reduce_messages(b)) for b in batches)
+        level = [partial] * len(batches)
+    if len(chunks) == 1:
+        # generate_summary still reduces a single partial
+        calls += 1
+        tokens += prompt_tokens(reduce_messages(partial))
+    return calls, tokens
+
+
+if __name__ == "__main__":
+    ok = True
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            transcript = f.read()
+        # What Whisper gives for some recordings, one endless sentence
+        unpunctuated = re.sub(r"[.!?]", "", transcript)
+        print(f"{path}: {count_tokens(transcript)} transcript tokens")
+        for name, chunks in [
+            ("3500 chars", split_by_chars(transcript)),
+            ("tokens", _chunk_transcript(transcript, adaptive=False)),
+            ("tokens, adaptive", _chunk_transcript(transcript, adaptive=True)),
+            ("unpunctuated", _chunk_transcript(unpunctuated, adaptive=False)),
+            ("unpunct., adapt.", _chunk_transcript(unpunctuated, adaptive=True)),
+        ]:
+            calls, tokens = cost(chunks)
+            sizes = ", ".join(str(count_tokens(c)) for c in chunks)
+            print(f"  {name:>16}: {len(chunks)} chunks [{sizes}] -> {calls} calls, {tokens} prompt tokens")
+            if name != "3500 chars" and max(count_tokens(c) for c in chunks) > SUMMARY_CHUNK_TOKENS:
+                print(f"  {name:>16}: chunk over the {SUMMARY_CHUNK_TOKENS} token budget")
+                ok = False
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,35 @@
+# Measures how long a fresh process takes to import the FastAPI app (main.py).
+# Usage: python scripts/bench_cold_start.py [runs]
+# Set WHISPER_PRELOAD=tiny to include loading a model in the lifespan hook.
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import asyncio, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+async def _startup():
+    async with main.lifespan(main.app):
+        pass
+asyncio.run(_startup())
+print(f"{imported - start:.3f} {time.perf_counter() - start:.3f}")
+"""
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    imports, totals, walls = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True)
+        walls.append(time.perf_counter() - start)
+        imported, total = map(float, out.stdout.strip().splitlines()[-1].split())
+        imports.append(imported)
+        totals.append(total)
+    print(f"import main:            {sum(imports) / runs:.3f}s")
+    print(f"import + lifespan:      {sum(totals) / runs:.3f}s")
+    print(f"process wall (w/ exit): {sum(walls) / runs:.3f}s")
@@ -0,0 +1,48 @@
+# Fires concurrent chat completions through utils/llm.py, ideally against
+# scripts/fake_openai.py with injected 429s, and checks that every call succeeds.
+# Usage: FAKE_OPENAI_429_RATE=0.3 FAKE_OPENAI_LATENCY=0.2 python scripts/fake_openai.py
+#        OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=fake LLM_RPM=600 \
+#        python scripts/bench_llm.py [calls] [threads]
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.pipeline import SUMMARY_MODEL
+from utils.llm import chat_completion
+from utils import metrics
+
+
+def call(i):
+    try:
+        chat_completion(
+            messages=[{"role": "user", "content": f"Summarize sermon part {i}."}],
+            model=SUMMARY_MODEL,
+            max_tokens=100,
+        )
+        return True
+    except Exception as e:
+        print(f"call {i} failed: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        ok = sum(pool.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+
+    stats = metrics.snapshot()
+    counters = stats["counters"]
+    latency = stats["latencies"].get("llm_call_seconds", {})
+    print(f"{ok}/{calls} calls succeeded in {elapsed:.1f}s ({ok / elapsed * 60:.0f} requests/min)")
+    print(f"429s: {counters.get('llm_rate_limited', 0):.0f}, retries: {counters.get('llm_retries', 0):.0f}")
+    if latency:
+        print(f"call latency p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s")
+    print(f"tokens: {counters.get('llm_prompt_tokens', 0):.0f} prompt, {counters.get('llm_completion_tokens', 0):.0f} completion")
+    sys.exit(0 if ok == calls else 1)
@@ -0,0 +1,124 @@
+# Compares the old summary prompt layout (instructions around the variable data) with the
+# prefix-stable one (static system prompt first, data last) against scripts/fake_openai.py,
+# which simulates prefix caching: per call latency, prompt/cached/completion tokens and cost.
+# Usage: FAKE_OPENAI_LATENCY=0.2 FAKE_OPENAI_PREFILL_SECONDS_PER_1K=0.3 python scripts/fake_openai.py
+#        OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=fake \
+#        python scripts/bench_prompt_cache.py transcript.txt [more.txt ...]
+# Run the fake with FAKE_OPENAI_CACHE_MIN_TOKENS=256 too, OpenAI only caches prefixes of 1024+ tokens.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import summarize
+from utils.llm import TokenUsage
+from utils.metrics import summarize_samples
+
+# USD per million tokens (gpt-4o-mini), cached prompt tokens are billed at half price
+PRICE_PROMPT = float(os.getenv("BENCH_PRICE_PROMPT", "0.15"))
+PRICE_CACHED = float(os.getenv("BENCH_PRICE_CACHED", "0.075"))
+PRICE_COMPLETION = float(os.getenv("BENCH_PRICE_COMPLETION", "0.60"))
+
+# The prompts generate_summary used before
+OLD_SYS = (
+    "You produce concise, accurate sermon notes. With no fluff. "
+    "Never invent facts or verses not in the transcript."
+)
+OLD_MAP_USER_TMPL = """
+You are a gospel sermon note writer and summarizer.
+
+INSTRUCTIONS:
+- Use only the transcript content; do not improvise.
+- Extract key points from the sermon.
+- Write in expressive bullet style, e.g., “The way of the Lord is… (Genesis 1:1)”.
+- If Bible verses are mentioned, include them after the point.
+- Normalize spoken verse formats, e.g., “John chapter 3 verse to 5” -> “John 3:2–5”.
+- Do NOT add verses if none are mentioned.
+- Include headings/subheadings where clearly implied.
+- If this is not a sermon, say exactly: “This is not a sermon.”
+
+TRANSCRIPT (Part {part} of {total}):
+{chunk}
+
+Summarize now into 5–10 clear bullets (with no intro/outro).
+"""
+OLD_REDUCE_USER_TMPL = """
+You are a gospel sermon note writer.
+
+Here are partial bullet lists from multiple transcript chunks:
+
+{bullets}
+
+Please merge them into a single, non-redundant set of bullets:
+- Keep all distinct key points.
+- Remove duplicates and overlaps.
+- Preserve Bible verses and normalized references.
+- Keep headings/subheadings if present.
+- Maintain the concise expressive style.
+"""
+
+
+def old_map_messages(chunk, part, total):
+    return [
+        {"role": "system", "content": OLD_SYS},
+        {"role": "user", "content": OLD_MAP_USER_TMPL.format(chunk=chunk, part=part, total=total)},
+    ]
+
+
+def old_reduce_messages(bullets):
+    return [
+        {"role": "system", "content": OLD_SYS},
+        {"role": "user", "content": OLD_REDUCE_USER_TMPL.format(bullets=bullets)},
+    ]
+
+
+def run(transcripts, layout):
+    new = (summarize.map_messages, summarize.reduce_messages, summarize.SUMMARY_PROMPT_CACHE_KEY)
+    if layout == "old":
+        summarize.map_messages, summarize.reduce_messages = old_map_messages, old_reduce_messages
+        summarize.SUMMARY_PROMPT_CACHE_KEY = ""
+
+    latencies = []
+    chat_completion = summarize.chat_completion
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return chat_completion(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    summarize.chat_completion = timed
+    usage = TokenUsage()
+    try:
+        for transcript in transcripts:
+            # fast_path off, so every sermon goes through map and reduce
+            summarize.generate_summary(transcript, fast_path=False, usage=usage)
+    finally:
+        summarize.chat_completion = chat_completion
+        summarize.map_messages, summarize.reduce_messages, summarize.SUMMARY_PROMPT_CACHE_KEY = new
+
+    cost = (
+        (usage.prompt_tokens - usage.cached_tokens) * PRICE_PROMPT
+        + usage.cached_tokens * PRICE_CACHED
+        + usage.completion_tokens * PRICE_COMPLETION
+    ) / 1e6
+    stats = summarize_samples(latencies)
+    print(f"{layout} prompts: {usage}")
+    print(f"  per call p50 {stats['p50']:.2f}s p95 {stats['p95']:.2f}s, ${cost:.5f} "
+          f"(${cost / len(transcripts):.5f} per sermon)")
+    return usage, cost
+
+
+if __name__ == "__main__":
+    transcripts = []
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            transcripts.append(f.read())
+
+    old_usage, old_cost = run(transcripts, "old")
+    new_usage, new_cost = run(transcripts, "new")
+    print(f"prompt tokens {new_usage.prompt_tokens - old_usage.prompt_tokens:+d}, "
+          f"cached {new_usage.cached_tokens - old_usage.cached_tokens:+d}, "
+          f"cost {(new_cost - old_cost) / old_cost * 100:+.1f}%")
@@ -0,0 +1,36 @@
+# Time to the first summary bullet with and without streaming, against scripts/fake_openai.py.
+# Usage: FAKE_OPENAI_LATENCY=0.5 FAKE_OPENAI_TOKEN_SECONDS=0.02 python scripts/fake_openai.py
+#        OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=fake \
+#        python scripts/bench_stream.py transcript.txt [more.txt ...]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import summarize
+
+
+def run(transcript: str, stream: bool):
+    summarize.SUMMARY_STREAM = stream
+    start = time.perf_counter()
+    first = {}
+
+    def on_bullet(stage, part, bullet):
+        first.setdefault(stage, time.perf_counter() - start)
+
+    bullets = summarize.generate_summary(transcript, on_bullet=on_bullet)
+    total = time.perf_counter() - start
+    # Without streaming a call's bullets all arrive when it returns
+    return first.get("map", first.get("summary")), first.get("summary"), total, len(bullets)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            transcript = f.read()
+        print(f"{path}:")
+        for stream in (False, True):
+            first, first_final, total, count = run(transcript, stream)
+            print(f"  stream {'on ' if stream else 'off'}: first bullet {first:.2f}s, "
+                  f"first final bullet {first_final:.2f}s, done {total:.2f}s ({count} bullets)")
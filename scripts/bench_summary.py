@@ -0,0 +1,43 @@
+# Times generate_summary on transcript files, ideally against scripts/fake_openai.py, and
+# reports p50/p95 latency per transcript size bucket with and without the fast path.
+# Usage: OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=fake \
+#        python scripts/bench_summary.py transcript.txt [more.txt ...] [--repeat 5]
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.summarize import generate_summary, latency_bucket
+from utils.tokens import count_tokens
+from utils.metrics import summarize_samples
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    repeat = 1
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+
+    transcripts = []
+    for path in args:
+        with open(path) as f:
+            transcripts.append(f.read())
+
+    for fast_path in (False, True):
+        latencies = defaultdict(list)
+        for transcript in transcripts:
+            bucket = latency_bucket(count_tokens(transcript))
+            for _ in range(repeat):
+                start = time.perf_counter()
+                bullets = generate_summary(transcript, fast_path=fast_path)
+                latencies[bucket].append(time.perf_counter() - start)
+            print(f"{len(transcript)} chars -> {len(bullets)} bullets")
+
+        print(f"fast path {'on' if fast_path else 'off'}:")
+        for bucket, values in latencies.items():
+            stats = summarize_samples(values)
+            print(f"  {bucket:>8} tokens: p50 {stats['p50']:.2f}s  p95 {stats['p95']:.2f}s  ({stats['count']} runs)")
@@ -0,0 +1,32 @@
+# Compares sequential vs parallel chunked transcription on one recording.
+# Usage: python scripts/bench_transcribe.py sermon.mp3 [workers] [segment_minutes]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.transcribe import iter_segments, iter_segments_parallel
+
+
+def _timed(segments):
+    start = time.perf_counter()
+    count = sum(1 for _ in segments)
+    return time.perf_counter() - start, count
+
+
+if __name__ == "__main__":
+    path = sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 2)
+    segment_minutes = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    seq_time, seq_count = _timed(iter_segments(path))
+    print(f"sequential: {seq_time:.1f}s ({seq_count} segments)")
+
+    # The first parallel run pays for starting the pool and loading a model per process
+    par_time, par_count = _timed(iter_segments_parallel(path, workers, segment_minutes))
+    print(f"parallel x{workers} (cold pool): {par_time:.1f}s ({par_count} segments)")
+    par_time, par_count = _timed(iter_segments_parallel(path, workers, segment_minutes))
+    print(f"parallel x{workers} (warm pool): {par_time:.1f}s ({par_count} segments)")
+
+    print(f"speedup: {seq_time / par_time:.2f}x")
@@ -0,0 +1,42 @@
+# Measures how much audio the VAD pre-pass skips and the wall time it saves.
+# Usage: python scripts/bench_vad.py sermon.mp3 [energy|silero ...]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.transcribe import iter_segments
+from utils.whisper_models import get_model
+from utils import metrics
+
+
+def _timed(path, vad):
+    before = metrics.snapshot()["counters"]
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_segments(path, vad=vad))
+    elapsed = time.perf_counter() - start
+    after = metrics.snapshot()["counters"]
+    audio = after.get("vad_audio_seconds", 0) - before.get("vad_audio_seconds", 0)
+    skipped = after.get("vad_skipped_seconds", 0) - before.get("vad_skipped_seconds", 0)
+    return elapsed, count, audio, skipped
+
+
+if __name__ == "__main__":
+    path = sys.argv[1]
+    modes = sys.argv[2:] or ["energy", "silero"]
+
+    # Load the model first so it isn't part of the first measurement
+    get_model()
+
+    base_time, base_count, _, _ = _timed(path, "off")
+    print(f"no vad: {base_time:.1f}s ({base_count} segments)")
+
+    for mode in modes:
+        elapsed, count, audio, skipped = _timed(path, mode)
+        pct = skipped / audio * 100 if audio else 0
+        print(
+            f"{mode}: {elapsed:.1f}s ({count} segments), "
+            f"skipped {skipped:.0f}s of {audio:.0f}s audio ({pct:.1f}%), "
+            f"saved {base_time - elapsed:.1f}s ({(1 - elapsed / base_time) * 100:.1f}%)"
+        )
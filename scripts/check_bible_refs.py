@@ -0,0 +1,74 @@
+# Checks utils.bible_refs against references that must be found and everyday phrases
+# that must not turn into one ("my job two years ago" is not Job 2).
+# Usage: python scripts/check_bible_refs.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.bible_refs import StreamingReferenceDetector, find_bible_references
+
+FOUND = [
+    ("For God so loved the world, John 3:16", ["John 3:16"]),
+    ("John three sixteen", ["John 3:16"]),
+    ("first Corinthians chapter thirteen verse four to seven", ["1 Corinthians 13:4-7"]),
+    ("Psalm twenty three", ["Psalms 23"]),
+    ("Hebrews eleven one", ["Hebrews 11:1"]),
+    ("turn with me to Mark chapter 10", ["Mark 10"]),
+    ("Luke 2:10 and Daniel chapter one", ["Luke 2:10", "Daniel 1"]),
+    ("mark 10:45", ["Mark 10:45"]),
+    ("Mark chapter ten", ["Mark 10"]),
+    ("job chapter two verse three", ["Job 2:3"]),
+    ("Numbers 6:24-26", ["Numbers 6:24-26"]),
+    ("Acts 2:1 and Acts chapter four", ["Acts 2:1", "Acts 4"]),
+    ("Romans eight", ["Romans 8"]),
+    ("Dan 9:27", ["Daniel 9:27"]),
+]
+
+NOT_FOUND = [
+    "my job two years ago",
+    "mark ten people",
+    "Dan ten minutes",
+    "two numbers 4 you",
+    "he acts 3 times a week",
+    "james 2 weeks later",
+    "I told John three times",
+    "Luke two weeks ago",
+    "Daniel one day said",
+    "Amos five of us went",
+    "Phil two kids",
+    "testing mic one two three",
+    "Mark 10 people came",
+    "Acts two",
+    "John 40",
+]
+
+
+def check() -> bool:
+    ok = True
+    for text, expected in FOUND:
+        got = [r["reference"] for r in find_bible_references(text)]
+        if got != expected:
+            print(f"MISSED  {text!r}: expected {expected}, got {got}")
+            ok = False
+    for text in NOT_FOUND:
+        got = [r["reference"] for r in find_bible_references(text)]
+        if got:
+            print(f"INVENTED  {text!r}: got {got}")
+            ok = False
+
+    # The same rules hold when the transcript arrives segment by segment
+    detector = StreamingReferenceDetector()
+    for k, segment in enumerate(["I quit my job", "two years ago and read", "Mark 10:45", "with mark ten people"]):
+        detector.feed(segment, k, k + 1)
+    got = [r["reference"] for r in detector.finish()]
+    if got != ["Mark 10:45"]:
+        print(f"STREAMING  expected ['Mark 10:45'], got {got}")
+        ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    ok = check()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,51 @@
+# Queues many emails through utils/email against scripts/fake_resend.py and checks that
+# send_email returns at once and every email is delivered, through injected failures.
+# Usage: FAKE_RESEND_ERROR_RATE=0.2 FAKE_RESEND_429_RATE=0.1 python scripts/fake_resend.py
+#        EMAIL_API_URL=http://127.0.0.1:8788 RESEND_API_KEY=fake EMAIL_BACKOFF_BASE=0.2 \
+#        python scripts/check_email_outbox.py [emails] [invalid]
+# With invalid > 0 that many addresses are refused by the fake, only those may be lost.
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.email import EMAIL_API_URL, send_email, start_email_sender, stop_email_sender
+from utils import metrics
+
+
+async def main(count: int, invalid: int = 0):
+    before = httpx.get(f"{EMAIL_API_URL}/stats").json()
+    await start_email_sender()
+
+    run = uuid.uuid4().hex[:8]
+    start = time.perf_counter()
+    for i in range(count):
+        name = "invalid" if i < invalid else "check"
+        send_email(f"{name}-{run}-{i}@example.com", "Outbox check", f"<p>Email {i}</p>")
+    queued = time.perf_counter() - start
+
+    await stop_email_sender()
+    elapsed = time.perf_counter() - start
+    after = httpx.get(f"{EMAIL_API_URL}/stats").json()
+
+    delivered = after["emails"] - before["emails"]
+    requests = after["requests"] - before["requests"]
+    counters = metrics.snapshot()["counters"]
+    print(f"queued {count} emails in {queued * 1000:.1f} ms ({queued / count * 1e6:.0f} us per send_email)")
+    print(f"delivered {delivered} in {elapsed:.2f}s with {requests} requests, "
+          f"{counters.get('email_retries', 0):.0f} retries, {counters.get('emails_failed', 0):.0f} failed")
+    return delivered == count - invalid and counters.get("emails_failed", 0) == invalid
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 0,
+    ))
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,62 @@
+# Runs several worker processes against the shared (sql) OTP backend and checks that
+# codes set in one process verify in another, that the per-email send limit holds under
+# concurrent sends, and that a code is used at most once.
+# Usage: DATABASE_URL=sqlite:///./otp.db OTP_BACKEND=sql python scripts/check_otp_workers.py [processes] [emails]
+import os
+import sys
+import uuid
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.otp_store import OTP_MAX_ATTEMPTS, OTP_SEND_LIMIT, create_otp_table, set_otp, sweep_otps, verify_otp
+
+CODE = "123456"
+
+
+def send(email):
+    return set_otp(email, CODE) is None
+
+
+def verify(args):
+    email, code = args
+    return verify_otp(email, code)
+
+
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    emails = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    create_otp_table()
+    run = uuid.uuid4().hex[:8]
+    addresses = [f"check-{run}-{i}@example.com" for i in range(emails)]
+    ok = True
+
+    with Pool(processes) as pool:
+        # Codes are set and verified by different processes
+        sent = pool.map(send, addresses, chunksize=1)
+        verified = pool.map(verify, [(a, CODE) for a in reversed(addresses)], chunksize=1)
+        print(f"cross process: {sum(sent)}/{emails} sent, {sum(verified)}/{emails} verified")
+        ok &= all(sent) and all(verified)
+
+        # Only OTP_SEND_LIMIT sends per email get through, however many race
+        email = f"limit-{run}@example.com"
+        sent = sum(pool.map(send, [email] * (OTP_SEND_LIMIT * 4), chunksize=1))
+        print(f"send limit: {sent} of {OTP_SEND_LIMIT * 4} concurrent sends accepted (limit {OTP_SEND_LIMIT})")
+        ok &= sent == OTP_SEND_LIMIT
+
+        # A correct code raced by every process is accepted exactly once
+        used = sum(pool.map(verify, [(email, CODE)] * processes * 2, chunksize=1))
+        print(f"single use: {used} of {processes * 2} concurrent verifies accepted")
+        ok &= used == 1
+
+        # After OTP_MAX_ATTEMPTS wrong guesses even the right code is refused
+        email = f"attempts-{run}@example.com"
+        send(email)
+        pool.map(verify, [(email, "000000")] * OTP_MAX_ATTEMPTS, chunksize=1)
+        locked = not verify((email, CODE))
+        print(f"attempt limit: code refused after {OTP_MAX_ATTEMPTS} wrong guesses: {locked}")
+        ok &= locked
+
+    print(f"swept {sweep_otps()} expired codes")
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,58 @@
+# Fires many simultaneous usage increments for one user and checks that none are lost,
+# both for direct UPSERTs and for the buffered path the workers use.
+# Usage: DATABASE_URL=sqlite:///./usage.db python scripts/check_usage_concurrency.py [user_id] [jobs] [threads]
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete
+from sqlmodel import SQLModel
+from config.db import engine
+import models.user  # noqa: F401, for the foreign keys
+import models.user_subscriptions  # noqa: F401
+from models.usage_record import UsageRecord
+from utils.usage import flush_usage, get_usage, record_usage, upsert_usage, usage_month
+
+# A month nobody uses, so the direct check starts from zero and can clean up after itself
+TEST_MONTH = date(1999, 1, 1)
+
+
+if __name__ == "__main__":
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+    SQLModel.metadata.create_all(engine, tables=[UsageRecord.__table__])
+
+    # Every job is its own UPSERT, all racing on the same (user, month) row
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: upsert_usage({(user_id, TEST_MONTH): (1, 60, None)}), range(jobs)))
+    direct = get_usage(user_id, TEST_MONTH)
+    print(f"direct upserts: count={direct.count} seconds={direct.seconds} (expected {jobs}, {jobs * 60})")
+
+    # Buffered, jobs finish concurrently while flushes run in between
+    before = get_usage(user_id, usage_month())
+
+    def finish_job(i):
+        record_usage(user_id, 60)
+        if i % 10 == 0:
+            flush_usage()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(finish_job, range(jobs)))
+    flush_usage()
+    after = get_usage(user_id, usage_month())
+    count, seconds = after.count - before.count, after.seconds - before.seconds
+    print(f"buffered: count=+{count} seconds=+{seconds} (expected +{jobs}, +{jobs * 60})")
+
+    # To undo the increments made by this check
+    with engine.begin() as conn:
+        conn.execute(delete(UsageRecord).where(UsageRecord.user_id == user_id, UsageRecord.usage_month == TEST_MONTH))
+    upsert_usage({(user_id, usage_month()): (-jobs, -jobs * 60, None)})
+
+    ok = direct == (jobs, jobs * 60) and (count, seconds) == (jobs, jobs * 60)
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,145 @@
+# A tiny stand-in for the OpenAI chat completions API, for local load tests.
+# Usage: python scripts/fake_openai.py [port]
+# then run the app/worker with OPENAI_BASE_URL=http://127.0.0.1:8787/v1
+#
+# FAKE_OPENAI_LATENCY      seconds to wait before answering each request (default 1.0)
+# FAKE_OPENAI_429_RATE     fraction of requests answered with a 429 (default 0)
+# FAKE_OPENAI_RETRY_AFTER  Retry-After header sent with those 429s, in seconds (default 1)
+# FAKE_OPENAI_PREFILL_SECONDS_PER_1K  extra wait per 1000 uncached prompt tokens (default 0)
+# FAKE_OPENAI_TOKEN_SECONDS           time to write each completion token (default 0), streamed
+#                                     requests ("stream": true) get them as SSE chunks
+# FAKE_OPENAI_CACHE_MIN_TOKENS        shortest prompt prefix that is cached, like OpenAI's
+#                                     (default 1024, then in blocks of 128 tokens), 0 = no cache
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", "1.0"))
+RATE_LIMIT_RATE = float(os.getenv("FAKE_OPENAI_429_RATE", "0"))
+RETRY_AFTER = os.getenv("FAKE_OPENAI_RETRY_AFTER", "1")
+PREFILL_SECONDS_PER_1K = float(os.getenv("FAKE_OPENAI_PREFILL_SECONDS_PER_1K", "0"))
+TOKEN_SECONDS = float(os.getenv("FAKE_OPENAI_TOKEN_SECONDS", "0"))
+CACHE_MIN_TOKENS = int(os.getenv("FAKE_OPENAI_CACHE_MIN_TOKENS", "1024"))
+CACHE_BLOCK_TOKENS = 128
+CHARS_PER_TOKEN = 4
+
+# Hashes of every cached prompt prefix, one per block boundary
+prefix_cache = set()
+cache_lock = threading.Lock()
+
+
+# Tokens at the start of the prompt seen in an earlier request, then caches this prompt's prefixes
+def cached_prefix_tokens(prompt: str) -> int:
+    if CACHE_MIN_TOKENS <= 0:
+        return 0
+    block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+    digest = hashlib.sha256()
+    cached, prefixes = 0, []
+    for end in range(block, len(prompt) + 1, block):
+        digest.update(prompt[end - block:end].encode())
+        if end // CHARS_PER_TOKEN >= CACHE_MIN_TOKENS:
+            prefixes.append((end // CHARS_PER_TOKEN, digest.hexdigest()))
+    with cache_lock:
+        for tokens, key in prefixes:
+            if key not in prefix_cache:
+                break
+            cached = tokens
+        prefix_cache.update(key for _, key in prefixes)
+    return cached
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "Not found"}})
+            return
+
+        if random.random() < RATE_LIMIT_RATE:
+            self._send(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": RETRY_AFTER},
+            )
+            return
+
+        prompt = "".join(f"{m.get('role')}\n{m.get('content', '')}\n" for m in body.get("messages", []))
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        cached_tokens = cached_prefix_tokens(prompt)
+        time.sleep(LATENCY + (prompt_tokens - cached_tokens) / 1000 * PREFILL_SECONDS_PER_1K)
+        content = "\n".join(f"- Fake point {i} ({len(prompt)} prompt chars)" for i in range(1, 6))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // CHARS_PER_TOKEN,
+            "total_tokens": prompt_tokens + len(content) // CHARS_PER_TOKEN,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        if body.get("stream"):
+            self._stream(body, content, usage)
+            return
+
+        time.sleep(len(content) // CHARS_PER_TOKEN * TOKEN_SECONDS)
+        self._send(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    # Server-sent events, one chunk per token, then the usage chunk when asked for and [DONE]
+    def _stream(self, body: dict, content: str, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+        }
+        pieces = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)]
+        for i, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            self._event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            time.sleep(TOKEN_SECONDS)
+        self._event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._event({**base, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _event(self, payload: dict):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+        self.wfile.flush()
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8787
+    print(f"Fake OpenAI listening on http://127.0.0.1:{port}/v1")
+    ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler).serve_forever()
@@ -0,0 +1,93 @@
+# A tiny stand-in for the Resend email API, for local tests of the email outbox.
+# Usage: python scripts/fake_resend.py [port]
+# then run the app with EMAIL_API_URL=http://127.0.0.1:8788 (and any RESEND_API_KEY)
+# GET /stats returns how many requests and emails it received.
+#
+# FAKE_RESEND_LATENCY      seconds to wait before answering each request (default 0.5)
+# FAKE_RESEND_ERROR_RATE   fraction of requests answered with a 503 (default 0)
+# FAKE_RESEND_429_RATE     fraction of requests answered with a 429 (default 0)
+# FAKE_RESEND_RETRY_AFTER  Retry-After header sent with those 429s, in seconds (default 1)
+# A recipient containing "invalid" gets the whole request refused with a 422, like Resend
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY = float(os.getenv("FAKE_RESEND_LATENCY", "0.5"))
+ERROR_RATE = float(os.getenv("FAKE_RESEND_ERROR_RATE", "0"))
+RATE_LIMIT_RATE = float(os.getenv("FAKE_RESEND_429_RATE", "0"))
+RETRY_AFTER = os.getenv("FAKE_RESEND_RETRY_AFTER", "1")
+
+stats = {"requests": 0, "batches": 0, "emails": 0, "errors": 0, "rate_limited": 0}
+recipients = set()
+stats_lock = threading.Lock()
+
+
+class FakeResendHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/stats":
+            self._send(404, {"message": "Not found"})
+            return
+        with stats_lock:
+            self._send(200, {**stats, "recipients": len(recipients)})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path not in ("/emails", "/emails/batch"):
+            self._send(404, {"message": "Not found"})
+            return
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._send(401, {"message": "Missing API key"})
+            return
+
+        with stats_lock:
+            stats["requests"] += 1
+        roll = random.random()
+        if roll < RATE_LIMIT_RATE:
+            with stats_lock:
+                stats["rate_limited"] += 1
+            self._send(429, {"message": "Too many requests"}, headers={"Retry-After": RETRY_AFTER})
+            return
+        if roll < RATE_LIMIT_RATE + ERROR_RATE:
+            with stats_lock:
+                stats["errors"] += 1
+            self._send(503, {"message": "Service unavailable"})
+            return
+
+        time.sleep(LATENCY)
+        emails = body if self.path == "/emails/batch" else [body]
+        if any("invalid" in (e.get("to") or "") for e in emails):
+            with stats_lock:
+                stats["errors"] += 1
+            self._send(422, {"message": "Invalid `to` field"})
+            return
+        with stats_lock:
+            stats["batches"] += self.path == "/emails/batch"
+            stats["emails"] += len(emails)
+            recipients.update(e.get("to") for e in emails)
+        ids = [{"id": uuid.uuid4().hex} for _ in emails]
+        self._send(200, {"data": ids} if self.path == "/emails/batch" else ids[0])
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8788
+    print(f"Fake Resend listening on http://127.0.0.1:{port}")
+    ThreadingHTTPServer(("127.0.0.1", port), FakeResendHandler).serve_forever()
@@ -0,0 +1,52 @@
+import subprocess
+from typing import Optional
+import ffmpeg
+import mutagen
+
+# Upper bound for the packet scan, a demux of a few hours of audio takes seconds
+PROBE_TIMEOUT_SECONDS = 60
+
+
+# Length of a recording in seconds, read from the container headers without decoding.
+# mutagen covers mp3/m4a/ogg/flac/wav in-process, ffprobe the rest (e.g. webm). Browser
+# MediaRecorder webm has no duration in its headers, then the packet timestamps are read.
+# Returns None if none of them can tell.
+def probe_duration(path: str) -> Optional[float]:
+    try:
+        audio = mutagen.File(path)
+        if audio is not None and audio.info and audio.info.length:
+            return float(audio.info.length)
+    except (mutagen.MutagenError, OSError):
+        pass
+
+    try:
+        duration = ffmpeg.probe(path)["format"].get("duration")
+        if duration:
+            return float(duration)
+    except (ffmpeg.Error, KeyError, ValueError, OSError):
+        return None
+    return _probe_packets(path)
+
+
+# To find where the last audio packet ends. Demuxes the whole file, nothing is decoded.
+def _probe_packets(path: str) -> Optional[float]:
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error", "-select_streams", "a:0",
+                "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0", path,
+            ],
+            capture_output=True,
+            timeout=PROBE_TIMEOUT_SECONDS,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    end = 0.0
+    for line in result.stdout.decode(errors="replace").splitlines():
+        try:
+            values = [float(v) for v in line.split(",")[:2]]
+        except ValueError:
+            continue
+        end = max(end, sum(values))
+    return end or None
@@ -1,37 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlmodel import Session
-from config.db import get_session
+from sqlmodel import Session, select
+from typing import Optional, Tuple
+from config.db import engine
 from models.user import User
 from utils.security import SECRET_KEY, ALGORITHM
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Decoded tokens -> user, so authenticated requests skip the JWT decode and the user
+# lookup. Per process: a profile change made through another worker shows up here
+# after at most AUTH_CACHE_SECONDS. 0 turns the cache off.
+AUTH_CACHE_SECONDS = float(os.getenv("AUTH_CACHE_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+_cache_lock = threading.Lock()
+# token -> (valid until, detached user), least recently used first
+_user_cache: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+
+
+def _cached_user(token: str) -> Optional[User]:
+    if AUTH_CACHE_SECONDS <= 0:
+        return None
+    with _cache_lock:
+        entry = _user_cache.get(token)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _user_cache[token]
+            return None
+        _user_cache.move_to_end(token)
+        user = entry[1]
+    # Each request gets its own copy, handlers can't change the cached one
+    return user.model_copy()
+
+
+def _cache_user(token: str, expires_at: Optional[float], user: User):
+    if AUTH_CACHE_SECONDS <= 0:
+        return
+    # Never past the token's own expiry
+    valid_until = time.time() + AUTH_CACHE_SECONDS
+    if expires_at is not None:
+        valid_until = min(valid_until, expires_at)
+    with _cache_lock:
+        _user_cache[token] = (valid_until, User.model_validate(user.model_dump()))
+        _user_cache.move_to_end(token)
+        while len(_user_cache) > AUTH_CACHE_MAX_ENTRIES:
+            _user_cache.popitem(last=False)
+
+
+# To drop every cached token of a user, after their profile or password changes
+def invalidate_user(user_id: int):
+    with _cache_lock:
+        for token in [t for t, (_, user) in _user_cache.items() if user.id == user_id]:
+            del _user_cache[token]
 
-def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> User:
-    credentials_exception = HTTPException(
-        status_code = 401,
-        detail="Could not validate credentials.",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+
+def user_from_token(token: str, session: Session) -> Optional[User]:
+    user = _cached_user(token)
+    if user is not None:
+        return user
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         sub: int = payload.get("sub")
         if sub is None:
-            raise credentials_exception
+            return None
     except JWTError:
-            raise credentials_exception
+        return None
 
-    user = None
     try:
         user_id = int(sub)
         user = session.get(User, user_id)
     except (TypeError, ValueError):
         user = session.exec(select(User).where(User.email == sub)).first()
 
+    if user is not None:
+        _cache_user(token, payload.get("exp"), user)
+    return user
+
+
+def _load_user(token: str) -> Optional[User]:
+    with Session(engine) as session:
+        return user_from_token(token, session)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    credentials_exception = HTTPException(
+        status_code = 401,
+        detail="Could not validate credentials.",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    # Cache hits are answered on the event loop, only misses go to the threadpool for the DB
+    user = _cached_user(token)
+    if user is None:
+        user = await run_in_threadpool(_load_user, token)
     if user is None:
         raise credentials_exception
 
-    return user
\ No newline at end of file
+    return user
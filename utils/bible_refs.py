@@ -0,0 +1,362 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Canonical book names with their chapter counts (used to reject "John 40" and friends)
+BOOK_CHAPTERS = [
+    ("Genesis", 50), ("Exodus", 40), ("Leviticus", 27), ("Numbers", 36), ("Deuteronomy", 34),
+    ("Joshua", 24), ("Judges", 21), ("Ruth", 4), ("1 Samuel", 31), ("2 Samuel", 24),
+    ("1 Kings", 22), ("2 Kings", 25), ("1 Chronicles", 29), ("2 Chronicles", 36),
+    ("Ezra", 10), ("Nehemiah", 13), ("Esther", 10), ("Job", 42), ("Psalms", 150),
+    ("Proverbs", 31), ("Ecclesiastes", 12), ("Song of Solomon", 8), ("Isaiah", 66),
+    ("Jeremiah", 52), ("Lamentations", 5), ("Ezekiel", 48), ("Daniel", 12), ("Hosea", 14),
+    ("Joel", 3), ("Amos", 9), ("Obadiah", 1), ("Jonah", 4), ("Micah", 7), ("Nahum", 3),
+    ("Habakkuk", 3), ("Zephaniah", 3), ("Haggai", 2), ("Zechariah", 14), ("Malachi", 4),
+    ("Matthew", 28), ("Mark", 16), ("Luke", 24), ("John", 21), ("Acts", 28), ("Romans", 16),
+    ("1 Corinthians", 16), ("2 Corinthians", 13), ("Galatians", 6), ("Ephesians", 6),
+    ("Philippians", 4), ("Colossians", 4), ("1 Thessalonians", 5), ("2 Thessalonians", 3),
+    ("1 Timothy", 6), ("2 Timothy", 4), ("Titus", 3), ("Philemon", 1), ("Hebrews", 13),
+    ("James", 5), ("1 Peter", 5), ("2 Peter", 3), ("1 John", 5), ("2 John", 1),
+    ("3 John", 1), ("Jude", 1), ("Revelation", 22),
+]
+
+# Abbreviations and alternative names, keyed by the name without its number
+BOOK_ALIASES = {
+    "Genesis": ["gen", "gn"],
+    "Exodus": ["exod", "ex"],
+    "Leviticus": ["lev"],
+    "Numbers": ["num"],
+    "Deuteronomy": ["deut", "dt"],
+    "Joshua": ["josh"],
+    "Judges": ["judg"],
+    "Samuel": ["sam"],
+    "Kings": ["kgs"],
+    "Chronicles": ["chron", "chr"],
+    "Nehemiah": ["neh"],
+    "Esther": ["esth"],
+    "Psalms": ["psalm", "ps", "psa", "pss"],
+    "Proverbs": ["prov"],
+    "Ecclesiastes": ["eccl", "eccles"],
+    "Song of Solomon": ["song of songs", "songs of solomon"],
+    "Isaiah": ["isa"],
+    "Jeremiah": ["jer"],
+    "Lamentations": ["lam"],
+    "Ezekiel": ["ezek"],
+    "Daniel": ["dan"],
+    "Hosea": ["hos"],
+    "Obadiah": ["obad"],
+    "Micah": ["mic"],
+    "Nahum": ["nah"],
+    "Habakkuk": ["hab"],
+    "Zephaniah": ["zeph"],
+    "Haggai": ["hag"],
+    "Zechariah": ["zech"],
+    "Malachi": ["mal"],
+    "Matthew": ["matt", "mt"],
+    "Mark": ["mk"],
+    "Luke": ["lk"],
+    "John": ["jn"],
+    "Acts": ["acts of the apostles"],
+    "Romans": ["rom"],
+    "Corinthians": ["cor"],
+    "Galatians": ["gal"],
+    "Ephesians": ["eph"],
+    "Philippians": ["phil"],
+    "Colossians": ["col"],
+    "Thessalonians": ["thess", "thes"],
+    "Timothy": ["tim"],
+    "Philemon": ["philem", "phlm"],
+    "Hebrews": ["heb"],
+    "James": ["jas"],
+    "Peter": ["pet"],
+    "Revelation": ["rev", "revelations"],
+}
+
+# Spoken and written forms of the "1", "2", "3" in front of numbered books
+ORDINAL_PREFIXES = {
+    "1": ["1", "1st", "first", "i"],
+    "2": ["2", "2nd", "second", "ii"],
+    "3": ["3", "3rd", "third", "iii"],
+}
+
+_UNITS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18,
+    "nineteen": 19,
+}
+_TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+
+_CHAPTER_WORDS = {"chapter", "chapters", "ch", "chap"}
+_VERSE_WORDS = {"verse", "verses", "vs", "vv", "v"}
+_RANGE_WORDS = {"-", "–", "—", "to", "through", "thru"}
+
+MAX_VERSE = 176  # Psalm 119
+
+# Words, numbers (with optional ordinal suffix) and the separators that matter.
+# Compiled once, the whole text is tokenized in one pass.
+_TOKEN_RE = re.compile(r"\d+(?:st|nd|rd|th)?|[A-Za-z]+|[:\-–—]")
+
+_BOOK_KEY = "$"
+
+# Book names that are also first names or everyday words ("I told John three times",
+# "my job two years ago", "Luke two weeks ago"). They need "chapter"/"verse" or a written
+# "3:16", or a capitalized name with a verse ("John three sixteen"), a bare chapter is
+# not enough.
+NAME_BOOK_WORDS = {
+    "job", "mark", "luke", "john", "acts", "james", "daniel", "amos", "joel", "ruth", "jonah",
+    "micah", "titus", "jude", "joshua", "esther", "ezra", "numbers", "judges",
+}
+# Abbreviations that are also names or words ("Phil two kids", "testing mic one two three"),
+# these always need "chapter"/"verse" or a written "3:16"
+ALIAS_BOOK_WORDS = {"phil", "mic", "dan", "tim", "sam", "num", "ex", "lam", "mal", "col", "hab", "gen", "jas"}
+
+
+# To tell whether a reference read after a name-like book token is meant as one
+def _plausible(token: str, written: str, location) -> bool:
+    _, verse, _, _, _, marked = location
+    if marked or (token not in NAME_BOOK_WORDS and token not in ALIAS_BOOK_WORDS):
+        return True
+    return token in NAME_BOOK_WORDS and written[0].isupper() and verse is not None
+
+
+def _build_trie() -> Dict:
+    trie: Dict = {}
+
+    def add(tokens: List[str], book: str):
+        node = trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[_BOOK_KEY] = book
+
+    for book, _ in BOOK_CHAPTERS:
+        number, _, name = book.partition(" ") if book[0].isdigit() else ("", "", book)
+        names = [name.lower()] + BOOK_ALIASES.get(name, [])
+        prefixes = ORDINAL_PREFIXES[number] if number else [None]
+        for prefix in prefixes:
+            for alias in names:
+                tokens = alias.split()
+                add([prefix] + tokens if prefix else tokens, book)
+    return trie
+
+
+# Word-level trie over every book name, abbreviation and numbered form
+_BOOK_TRIE = _build_trie()
+_MAX_CHAPTERS = dict(BOOK_CHAPTERS)
+
+
+def _parse_small_number(tokens: List[str], i: int) -> Optional[Tuple[int, int]]:
+    if i >= len(tokens):
+        return None
+    token = tokens[i]
+    if token in _UNITS:
+        return _UNITS[token], i + 1
+    if token in _TENS:
+        value = _TENS[token]
+        if i + 1 < len(tokens) and _UNITS.get(tokens[i + 1], 10) < 10:
+            return value + _UNITS[tokens[i + 1]], i + 2
+        return value, i + 1
+    return None
+
+
+# To read a number written as digits or spoken as words ("one hundred and nineteen").
+# Returns (value, index after the number) or None.
+def _parse_number(tokens: List[str], i: int) -> Optional[Tuple[int, int]]:
+    if i >= len(tokens):
+        return None
+    if tokens[i].isdigit():
+        return int(tokens[i]), i + 1
+
+    n = len(tokens)
+    hundreds = None
+    if tokens[i] == "hundred":
+        hundreds, i = 100, i + 1
+    elif tokens[i] in ("a", "one") and i + 1 < n and tokens[i + 1] == "hundred":
+        hundreds, i = 100, i + 2
+    if hundreds is None:
+        return _parse_small_number(tokens, i)
+
+    if i + 1 < n and tokens[i] == "and" and (tokens[i + 1] in _UNITS or tokens[i + 1] in _TENS):
+        i += 1
+    rest = _parse_small_number(tokens, i)
+    if rest:
+        return hundreds + rest[0], rest[1]
+    return hundreds, i
+
+
+# To parse the "3:16-18" / "chapter three verse sixteen to eighteen" part that follows
+# a book name. Returns (chapter, verse, end_chapter, end_verse, next index, marked) or
+# None, marked when "chapter"/"verse" or a ":" says this really is a location.
+def _parse_location(tokens: List[str], i: int):
+    n = len(tokens)
+    marked = False
+    if i < n and tokens[i] in _CHAPTER_WORDS:
+        i += 1
+        marked = True
+    parsed = _parse_number(tokens, i)
+    if not parsed:
+        return None
+    chapter, i = parsed
+    spoken = not tokens[i - 1].isdigit()
+
+    verse = None
+    if i + 1 < n and tokens[i] == ":":
+        parsed = _parse_number(tokens, i + 1)
+        if parsed:
+            (verse, i), marked = parsed, True
+    elif i < n and tokens[i] in _VERSE_WORDS:
+        parsed = _parse_number(tokens, i + 1)
+        if parsed:
+            (verse, i), marked = parsed, True
+    elif spoken:
+        # "John three sixteen"
+        parsed = _parse_number(tokens, i)
+        if parsed and not tokens[i].isdigit():
+            verse, i = parsed
+
+    end_chapter, end_verse = None, None
+    if i < n and tokens[i] in _RANGE_WORDS:
+        j = i + 1
+        if j < n and tokens[j] in (_VERSE_WORDS | _CHAPTER_WORDS):
+            j += 1
+        parsed = _parse_number(tokens, j)
+        if parsed:
+            value, j = parsed
+            if verse is not None and j + 1 < n and tokens[j] == ":":
+                # Range across chapters, "John 3:16-4:2"
+                cross = _parse_number(tokens, j + 1)
+                if cross:
+                    end_chapter, (end_verse, j) = value, cross
+                    i = j
+            elif verse is not None:
+                end_verse, i = value, j
+            else:
+                end_chapter, i = value, j
+
+    return chapter, verse, end_chapter, end_verse, i, marked
+
+
+def _format_reference(book: str, chapter: int, verse, end_chapter, end_verse) -> Optional[str]:
+    max_chapter = _MAX_CHAPTERS[book]
+    if not 1 <= chapter <= max_chapter:
+        return None
+    if verse is not None and not 1 <= verse <= MAX_VERSE:
+        return None
+
+    reference = f"{book} {chapter}"
+    if verse is not None:
+        reference += f":{verse}"
+        if end_chapter is not None and chapter < end_chapter <= max_chapter and end_verse:
+            reference += f"-{end_chapter}:{end_verse}"
+        elif end_verse is not None and verse < end_verse <= MAX_VERSE:
+            reference += f"-{end_verse}"
+    elif end_chapter is not None and chapter < end_chapter <= max_chapter:
+        reference += f"-{end_chapter}"
+    return reference
+
+
+def find_bible_references(text: str, unique: bool = True) -> List[Dict]:
+    """Finds Bible references in text, written ("1 Cor 13:4-7") or spoken
+    ("first Corinthians chapter thirteen verse four to seven").
+
+    Returns dicts with the canonical "Book C:V-V" reference and its character
+    offsets, in order of appearance. With unique=True only the first occurrence
+    of each reference is kept.
+    """
+    matches = list(_TOKEN_RE.finditer(text or ""))
+    tokens = [m.group().lower() for m in matches]
+    found: List[Dict] = []
+    seen = set()
+
+    i, n = 0, len(tokens)
+    while i < n:
+        # To find the longest book name starting at this token
+        node, j, book, book_end = _BOOK_TRIE, i, None, i
+        while j < n and tokens[j] in node:
+            node = node[tokens[j]]
+            j += 1
+            if _BOOK_KEY in node:
+                book, book_end = node[_BOOK_KEY], j
+        if book is None:
+            i += 1
+            continue
+
+        location = _parse_location(tokens, book_end)
+        reference = _format_reference(book, *location[:4]) if location else None
+        if reference is not None and not _plausible(tokens[i], matches[i].group(), location):
+            reference = None
+        if reference is None:
+            i += 1
+            continue
+
+        end = location[4]
+        if not unique or reference not in seen:
+            seen.add(reference)
+            found.append({
+                "reference": reference,
+                "start": matches[i].start(),
+                "end": matches[end - 1].end(),
+            })
+        i = end
+
+    return found
+
+
+class StreamingReferenceDetector:
+    """Detects references in a transcript while it is being produced.
+
+    Each Whisper segment is fed as it arrives. It is scanned together with the
+    previous segment, so a reference split across two segments ("John 3" |
+    ":16") is still found, and a reference touching the end of the text is held
+    back until the next segment shows whether it continues. Every reference
+    carries the start/end time of the audio it was heard in.
+    """
+
+    def __init__(self):
+        self._prev = ("", 0.0, 0.0)
+        # Characters of the previous segment already covered by a committed reference
+        self._done = 0
+        self._seen = set()
+        self.references: List[Dict] = []
+
+    def feed(self, text: str, start: float, end: float):
+        prev_text, prev_start, prev_end = self._prev
+        text = text.strip()
+        if not text:
+            return
+        combined = f"{prev_text} {text}" if prev_text else text
+        offset = len(combined) - len(text)
+
+        done = self._done
+        for ref in find_bible_references(combined, unique=False):
+            if ref["start"] < done:
+                continue
+            if ref["end"] >= len(combined):
+                # Might continue in the next segment
+                break
+            self._commit(
+                ref["reference"],
+                prev_start if ref["start"] < offset else start,
+                prev_end if ref["end"] <= offset else end,
+            )
+            done = ref["end"]
+
+        self._prev = (text, start, end)
+        self._done = max(0, done - offset)
+
+    def finish(self) -> List[Dict]:
+        prev_text, prev_start, prev_end = self._prev
+        for ref in find_bible_references(prev_text, unique=False):
+            if ref["start"] >= self._done:
+                self._commit(ref["reference"], prev_start, prev_end)
+        self._prev = ("", 0.0, 0.0)
+        self._done = 0
+        return self.references
+
+    def _commit(self, reference: str, start: float, end: float):
+        if reference in self._seen:
+            return
+        self._seen.add(reference)
+        self.references.append({"reference": reference, "start_time": start, "end_time": end})
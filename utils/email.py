@@ -1,6 +1,10 @@
+import asyncio
 import httpx
 import os
+import random
+from typing import List, Optional
 from dotenv import load_dotenv
+from utils import metrics
 
 load_dotenv()
 
@@ -10,25 +14,174 @@ RESEND_API_KEY = os.getenv("RESEND_API_KEY")
 
 FROM_EMAIL = os.getenv("FROM_EMAIL")
 
-def send_email(to: str, subject: str, html: str):
-    if not RESEND_API_KEY:
-        raise ValueError("RESEND_API_KEY not set in environment")
+# Point at scripts/fake_resend.py for local tests
+EMAIL_API_URL = os.getenv("EMAIL_API_URL", "https://api.resend.com").rstrip("/")
+# Queued emails sent in one request to the batch endpoint (Resend takes up to 100), 1 turns batching off
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "100"))
+EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", "5"))
+EMAIL_BACKOFF_BASE = float(os.getenv("EMAIL_BACKOFF_BASE", "1.0"))
+EMAIL_BACKOFF_MAX = float(os.getenv("EMAIL_BACKOFF_MAX", "60"))
+EMAIL_TIMEOUT_SECONDS = float(os.getenv("EMAIL_TIMEOUT_SECONDS", "10"))
+# Seconds the outbox gets at shutdown to send what is still queued
+EMAIL_DRAIN_SECONDS = float(os.getenv("EMAIL_DRAIN_SECONDS", "10"))
+
+# The outbox lives on the API's event loop, started in the lifespan
+_client: Optional[httpx.AsyncClient] = None
+_outbox: Optional[asyncio.Queue] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_sender: Optional[asyncio.Task] = None
+# Emails waiting for a retry, so shutdown knows the outbox isn't empty yet
+_retrying = 0
+
+
+class _Retryable(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _message(to: str, subject: str, html: str) -> dict:
+    return {"from": FROM_EMAIL, "to": to, "subject": subject, "html": html}
+
 
-    payload = {
-        "from": FROM_EMAIL,
-        "to": to,
-        "subject": subject,
-        "html": html
-    }
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=EMAIL_API_URL,
+        headers={"Authorization": f"Bearer {RESEND_API_KEY}"},
+        timeout=EMAIL_TIMEOUT_SECONDS,
+    )
 
-    headers = {
-        "Authorization": f"Bearer {RESEND_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
+async def _post(client: httpx.AsyncClient, messages: List[dict]):
     try:
-        response = httpx.post("https://api.resend.com/emails", json = payload, headers = headers)
-        response.raise_for_status()
+        if len(messages) == 1:
+            response = await client.post("/emails", json=messages[0])
+        else:
+            response = await client.post("/emails/batch", json=messages)
+    except httpx.TransportError as e:
+        raise _Retryable(str(e))
+    if response.status_code == 429 or response.status_code >= 500:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+        raise _Retryable(f"HTTP {response.status_code}", retry_after)
+    # Other errors (bad address, bad key) won't succeed on a retry
+    response.raise_for_status()
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    delay = random.uniform(0, min(EMAIL_BACKOFF_MAX, EMAIL_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+def _requeue(item):
+    global _retrying
+    _retrying -= 1
+    _outbox.put_nowait(item)
+
+
+async def _send_batch(items: List[tuple]):
+    global _retrying
+    try:
+        await _post(_client, [message for message, _ in items])
+        metrics.inc("emails_sent", len(items))
+    except _Retryable as e:
+        for message, attempt in items:
+            if attempt >= EMAIL_MAX_RETRIES:
+                metrics.inc("emails_failed")
+                print(f"Failed to send email to {message['to']} after {attempt + 1} attempts: {e}")
+                continue
+            delay = _backoff(attempt, e.retry_after)
+            metrics.inc("email_retries")
+            _retrying += 1
+            _loop.call_later(delay, _requeue, (message, attempt + 1))
+        print(f"Email send failed ({e}), {len(items)} email(s) retried with backoff")
     except httpx.HTTPError as e:
-        print(f"Failed to send email: {e}")
-        raise
+        # One bad message (e.g. an invalid address) fails the whole batch request,
+        # so the batch is sent again one message at a time and only that one is dropped
+        if len(items) > 1:
+            print(f"Email batch refused ({e}), sending its {len(items)} email(s) one by one")
+            for item in items:
+                await _send_batch([item])
+            return
+        metrics.inc("emails_failed")
+        print(f"Failed to send email to {items[0][0]['to']}: {e}")
+
+
+# To drain the outbox: waits for one email, then sends it together with whatever else is queued
+async def _drain_forever():
+    while True:
+        items = [await _outbox.get()]
+        while len(items) < EMAIL_BATCH_SIZE and not _outbox.empty():
+            items.append(_outbox.get_nowait())
+        metrics.set_gauge("email_outbox_depth", _outbox.qsize() + _retrying)
+        try:
+            await _send_batch(items)
+        except Exception as e:
+            print(f"Email sender error: {e}")
+        finally:
+            for _ in items:
+                _outbox.task_done()
+
+
+async def start_email_sender():
+    global _client, _outbox, _loop, _sender
+    _loop = asyncio.get_running_loop()
+    _client = _new_client()
+    _outbox = asyncio.Queue()
+    _sender = asyncio.create_task(_drain_forever())
+
+
+async def stop_email_sender():
+    global _sender, _client
+    if _sender is None:
+        return
+    # To give queued emails a chance to go out before the process exits
+    try:
+        await asyncio.wait_for(_wait_empty(), timeout=EMAIL_DRAIN_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"{_outbox.qsize() + _retrying} queued email(s) not sent at shutdown")
+    _sender.cancel()
+    await _client.aclose()
+    _sender = None
+
+
+async def _wait_empty():
+    while True:
+        await _outbox.join()
+        if not _retrying:
+            return
+        await asyncio.sleep(0.1)
+
+
+async def _send_now(message: dict):
+    async with _new_client() as client:
+        for attempt in range(EMAIL_MAX_RETRIES + 1):
+            try:
+                return await _post(client, [message])
+            except _Retryable as e:
+                if attempt == EMAIL_MAX_RETRIES:
+                    raise httpx.HTTPError(f"Failed to send email: {e}")
+                await asyncio.sleep(_backoff(attempt, e.retry_after))
+
+
+# Queues the email and returns right away, the outbox sends it in the background.
+# Safe from async routes and from threadpool (sync) routes. Without a running outbox
+# (scripts, workers) the email is sent before returning.
+def send_email(to: str, subject: str, html: str):
+    if not RESEND_API_KEY:
+        raise ValueError("RESEND_API_KEY not set in environment")
+
+    item = (_message(to, subject, html), 0)
+    if _sender is None:
+        asyncio.run(_send_now(item[0]))
+        return
+    try:
+        on_loop = asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        on_loop = False
+    if on_loop:
+        _outbox.put_nowait(item)
+    else:
+        _loop.call_soon_threadsafe(_outbox.put_nowait, item)
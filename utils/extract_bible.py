@@ -1,4 +1,4 @@
-import re
+from utils.bible_refs import find_bible_references
 
 BIBLE_BOOKS = [
     "Genesis", "Exodus", "Leviticus", "Numbers", "Deuteronomy",
@@ -16,16 +16,6 @@ BIBLE_BOOKS = [
 ]
 
 
-
 def detect_bible_verses(transcript: str)-> list[str]:
-    # To build a regex pattern
-    book_pattern = r"|".join(re.escape(book) for book in BIBLE_BOOKS)
-    pattern = rf"\b(?:{book_pattern})\s+\d{{1,3}}(?::\d{{1,3}}(?:-\d{{1,3}})?)?\b"
-
-    matches = re.findall(pattern, transcript, re.IGNORECASE)
-    # To clean and remove duplicates
-    cleaned = list(set(match.strip()  for match in matches))
-
-    print("CLEANED: ", cleaned)
-
-    return cleaned
\ No newline at end of file
+    # Single pass over the text with the precompiled extractor, unique refs in order of appearance
+    return [ref["reference"] for ref in find_bible_references(transcript)]
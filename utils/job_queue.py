@@ -0,0 +1,522 @@
+import os
+import gzip
+import json
+import uuid
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import update, delete, func, inspect, text, true
+from sqlmodel import SQLModel, Session, select
+from models.transcription_job import TranscriptionJob, TranscriptionWorker, JobStatus
+from utils import metrics
+
+load_dotenv()
+
+# The queue lives in its own table. JOB_DATABASE_URL lets a local setup point it at
+# SQLite (e.g. sqlite:///./jobs.db), otherwise it shares the main Postgres database.
+JOB_DATABASE_URL = os.getenv("JOB_DATABASE_URL")
+
+# Admission control, once this many jobs are waiting, new uploads get a 429
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "20"))
+JOB_RETRY_AFTER_SECONDS = int(os.getenv("JOB_RETRY_AFTER_SECONDS", "60"))
+
+# Workers refresh updated_at of their job this often (progress writes count too). A job
+# "processing" without a heartbeat for JOB_STALE_SECONDS belongs to a dead worker.
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "60"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# Uploads are refused (503) when no worker has checked in for this long, instead of
+# queueing jobs nobody will pick up
+JOB_WORKER_TIMEOUT_SECONDS = float(os.getenv("JOB_WORKER_TIMEOUT_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+# Longer recordings are refused at upload
+JOB_MAX_AUDIO_SECONDS = float(os.getenv("JOB_MAX_AUDIO_MINUTES", "240")) * 60
+# A job still running after this long is stuck (hung ffmpeg or model), its worker fails it
+# and exits so the supervisor starts a fresh one. The heartbeat alone would keep it forever.
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS") or 2 * JOB_MAX_AUDIO_SECONDS)
+# Shortest job first, with aging: every second a job waits counts as this many seconds
+# less audio, so a long upload is still picked up while short ones keep arriving
+JOB_AGING_FACTOR = float(os.getenv("JOB_AGING_FACTOR", "1.0"))
+# Assumed length for recordings whose duration couldn't be probed
+JOB_UNKNOWN_DURATION_SECONDS = 3600.0
+
+# Processing seconds per second of audio, used for estimates until enough jobs have finished
+JOB_REALTIME_FACTOR = float(os.getenv("JOB_REALTIME_FACTOR", "0.5"))
+# Number of transcription processes (worker.py), each runs one job at a time
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "1"))
+
+# Where uploads are kept until a worker picks them up (must be shared with the workers)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None
+if UPLOAD_DIR:
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Finished jobs are kept for JOB_RESULT_TTL_SECONDS after their last fetch, and at most
+# JOB_STORE_MAX_ENTRIES of them (least recently fetched go first). Expired jobs stay as
+# small tombstones for JOB_TOMBSTONE_SECONDS so clients get a 410 instead of a 404.
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", str(24 * 3600)))
+JOB_STORE_MAX_ENTRIES = int(os.getenv("JOB_STORE_MAX_ENTRIES", "1000"))
+JOB_TOMBSTONE_SECONDS = int(os.getenv("JOB_TOMBSTONE_SECONDS", str(7 * 24 * 3600)))
+JOB_SWEEP_INTERVAL = float(os.getenv("JOB_SWEEP_INTERVAL", "300"))
+
+# Results larger than this are gzipped to JOB_RESULT_DIR instead of being stored in the row
+JOB_RESULT_SPILL_BYTES = int(os.getenv("JOB_RESULT_SPILL_KB", "64")) * 1024
+JOB_RESULT_DIR = os.getenv("JOB_RESULT_DIR") or os.path.join(tempfile.gettempdir(), "gospelnote-jobs")
+# Only the end of a traceback is kept, that's where the error is
+JOB_TRACE_MAX_CHARS = int(os.getenv("JOB_TRACE_MAX_CHARS", "8000"))
+
+JOB_FINISHED = (JobStatus.DONE, JobStatus.ERROR)
+
+if JOB_DATABASE_URL:
+    from config.db import make_engine
+    job_engine = make_engine(JOB_DATABASE_URL)
+else:
+    from config.db import engine as job_engine
+
+
+def create_job_table():
+    SQLModel.metadata.create_all(job_engine, tables=[TranscriptionJob.__table__, TranscriptionWorker.__table__])
+
+    # A table created by an older version is missing the newer (nullable) columns
+    for table in (TranscriptionJob.__table__, TranscriptionWorker.__table__):
+        existing = {c["name"] for c in inspect(job_engine).get_columns(table.name)}
+        with job_engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=job_engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+    # On Postgres the status is a native enum, newer statuses have to be added to the type
+    if job_engine.dialect.name == "postgresql":
+        enum_name = TranscriptionJob.__table__.c.status.type.name
+        with job_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for member in JobStatus:
+                conn.execute(text(f"ALTER TYPE {enum_name} ADD VALUE IF NOT EXISTS '{member.name}'"))
+
+
+# To record that a worker is alive, called from its polling loop and job heartbeat,
+# together with its metrics
+def worker_seen(worker_id: str):
+    with Session(job_engine) as session:
+        session.merge(TranscriptionWorker(id=worker_id, seen_at=datetime.utcnow(), metrics=metrics.export()))
+        session.commit()
+
+
+def worker_gone(worker_id: str):
+    with Session(job_engine) as session:
+        session.execute(delete(TranscriptionWorker).where(TranscriptionWorker.id == worker_id))
+        session.commit()
+
+
+# The metrics exports of the workers that are alive, for the API's /metrics
+def worker_metrics() -> list:
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_WORKER_TIMEOUT_SECONDS)
+    with Session(job_engine) as session:
+        return [
+            row for row in session.exec(
+                select(TranscriptionWorker.metrics).where(TranscriptionWorker.seen_at >= cutoff)
+            ).all() if row
+        ]
+
+
+def workers_alive() -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_WORKER_TIMEOUT_SECONDS)
+    with Session(job_engine) as session:
+        return session.exec(
+            select(func.count()).select_from(TranscriptionWorker).where(TranscriptionWorker.seen_at >= cutoff)
+        ).one()
+
+
+def queue_depth() -> int:
+    with Session(job_engine) as session:
+        return session.exec(
+            select(func.count()).select_from(TranscriptionJob).where(TranscriptionJob.status == JobStatus.QUEUED)
+        ).one()
+
+
+def enqueue_job(
+    file_path: str,
+    audio_hash: Optional[str] = None,
+    duration_seconds: Optional[float] = None,
+    user_id: Optional[int] = None,
+) -> str:
+    job_id = uuid.uuid4().hex
+    with Session(job_engine) as session:
+        session.add(TranscriptionJob(
+            id=job_id, file_path=file_path, audio_hash=audio_hash,
+            duration_seconds=duration_seconds, user_id=user_id,
+        ))
+        session.commit()
+    return job_id
+
+
+# A user's queued and running jobs (count, seconds of audio), not metered until they finish
+def jobs_in_flight(user_id: int) -> Tuple[int, float]:
+    with Session(job_engine) as session:
+        count, seconds = session.exec(
+            select(func.count(), func.coalesce(func.sum(TranscriptionJob.duration_seconds), 0))
+            .where(
+                TranscriptionJob.user_id == user_id,
+                TranscriptionJob.status.in_([JobStatus.QUEUED, JobStatus.PROCESSING]),
+            )
+        ).one()
+    return count, float(seconds)
+
+
+# To record a job answered straight from the result cache, so it can still be polled
+def record_cached_job(
+    audio_hash: str,
+    result: Dict[str, Any],
+    duration_seconds: Optional[float] = None,
+    user_id: Optional[int] = None,
+) -> str:
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    result, result_path = _store_result(job_id, result)
+    with Session(job_engine) as session:
+        session.add(TranscriptionJob(
+            id=job_id,
+            file_path="",
+            audio_hash=audio_hash,
+            duration_seconds=duration_seconds,
+            user_id=user_id,
+            status=JobStatus.DONE,
+            result=result,
+            result_path=result_path,
+            started_at=now,
+            finished_at=now,
+        ))
+        session.commit()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[TranscriptionJob]:
+    with Session(job_engine) as session:
+        return session.get(TranscriptionJob, job_id)
+
+
+# To keep big results out of the table (and out of memory until someone asks for them)
+def _store_result(job_id: str, result: Dict[str, Any]):
+    data = json.dumps(result).encode()
+    if len(data) <= JOB_RESULT_SPILL_BYTES:
+        return result, None
+    os.makedirs(JOB_RESULT_DIR, exist_ok=True)
+    path = os.path.join(JOB_RESULT_DIR, f"{job_id}.json.gz")
+    # Write then rename, so readers never see a half written file
+    fd, tmp_path = tempfile.mkstemp(dir=JOB_RESULT_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(gzip.compress(data))
+    os.replace(tmp_path, path)
+    return None, path
+
+
+def load_job_result(job: TranscriptionJob) -> Optional[Dict[str, Any]]:
+    if not job.result_path:
+        return job.result
+    try:
+        with gzip.open(job.result_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, OSError, json.JSONDecodeError):
+        return None
+
+
+def _remove_result_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except (FileNotFoundError, TypeError):
+            pass
+
+
+# To mark a finished job as fetched, it is evicted last
+def touch_job(job_id: str):
+    with Session(job_engine) as session:
+        session.execute(
+            update(TranscriptionJob)
+            .where(TranscriptionJob.id == job_id, TranscriptionJob.status.in_(JOB_FINISHED))
+            .values(accessed_at=datetime.utcnow())
+        )
+        session.commit()
+
+
+def _schedule_score(duration: Optional[float], created_at: datetime, now: datetime) -> float:
+    waited = (now - created_at).total_seconds()
+    return (duration or JOB_UNKNOWN_DURATION_SECONDS) - JOB_AGING_FACTOR * waited
+
+
+# Queued jobs in the order workers will claim them
+def _scheduled_queue(session: Session, now: datetime):
+    # The queue is bounded by JOB_QUEUE_MAX_DEPTH, so it is cheap to rank in Python
+    queued = session.exec(
+        select(TranscriptionJob.id, TranscriptionJob.duration_seconds, TranscriptionJob.created_at)
+        .where(TranscriptionJob.status == JobStatus.QUEUED)
+    ).all()
+    return sorted(queued, key=lambda row: _schedule_score(row.duration_seconds, row.created_at, now))
+
+
+# To claim the next queued job (shortest first, see JOB_AGING_FACTOR). The conditional
+# UPDATE makes the claim atomic on both Postgres and SQLite, if another worker won the
+# race we simply try the next one.
+def claim_next_job(worker_id: str) -> Optional[TranscriptionJob]:
+    with Session(job_engine) as session:
+        for _ in range(5):
+            now = datetime.utcnow()
+            queue = _scheduled_queue(session, now)
+            if not queue:
+                return None
+            job_id = queue[0].id
+
+            claimed = session.execute(
+                update(TranscriptionJob)
+                .where(TranscriptionJob.id == job_id, TranscriptionJob.status == JobStatus.QUEUED)
+                .values(
+                    status=JobStatus.PROCESSING,
+                    worker_id=worker_id,
+                    attempts=TranscriptionJob.attempts + 1,
+                    started_at=now,
+                    updated_at=now,
+                )
+            )
+            session.commit()
+            if claimed.rowcount == 1:
+                return session.get(TranscriptionJob, job_id)
+    return None
+
+
+# Processing seconds per audio second, from the most recent finished jobs
+def _realtime_factor(session: Session) -> float:
+    rows = session.exec(
+        select(TranscriptionJob.duration_seconds, TranscriptionJob.started_at, TranscriptionJob.finished_at)
+        .where(
+            TranscriptionJob.status == JobStatus.DONE,
+            TranscriptionJob.duration_seconds > 0,
+            TranscriptionJob.file_path != "",  # cache hits took no time
+        )
+        .order_by(TranscriptionJob.finished_at.desc())
+        .limit(20)
+    ).all()
+    ratios = sorted(
+        (row.finished_at - row.started_at).total_seconds() / row.duration_seconds
+        for row in rows if row.started_at and row.finished_at
+    )
+    if len(ratios) < 3:
+        return JOB_REALTIME_FACTOR
+    return ratios[len(ratios) // 2]
+
+
+# When a queued or processing job should be done: the work of the jobs scheduled before
+# it shared across the workers, plus its own. None when it can't be estimated. An absolute
+# time (not "seconds left") so it stays the same between status events.
+def estimate_finish_at(job: TranscriptionJob) -> Optional[datetime]:
+    if job.status not in (JobStatus.QUEUED, JobStatus.PROCESSING) or not job.duration_seconds:
+        return None
+    now = datetime.utcnow()
+    with Session(job_engine) as session:
+        factor = _realtime_factor(session)
+
+        def remaining(duration, started_at):
+            total = (duration or JOB_UNKNOWN_DURATION_SECONDS) * factor
+            return max(0.0, total - (now - started_at).total_seconds()) if started_at else total
+
+        if job.status == JobStatus.PROCESSING:
+            left = remaining(job.duration_seconds, job.started_at)
+            return (now + timedelta(seconds=left)).replace(microsecond=0)
+
+        running = session.exec(
+            select(TranscriptionJob.duration_seconds, TranscriptionJob.started_at)
+            .where(TranscriptionJob.status == JobStatus.PROCESSING)
+        ).all()
+        ahead = sum(remaining(row.duration_seconds, row.started_at) for row in running)
+        for row in _scheduled_queue(session, now):
+            if row.id == job.id:
+                break
+            ahead += remaining(row.duration_seconds, None)
+
+    left = ahead / max(1, TRANSCRIBE_WORKERS) + remaining(job.duration_seconds, None)
+    return (now + timedelta(seconds=left)).replace(microsecond=0)
+
+
+# Estimates are reused for this long per job, every open event stream and long-poll
+# re-reads its job each JOB_WATCH_INTERVAL and the estimate costs several queries
+JOB_ESTIMATE_CACHE_SECONDS = float(os.getenv("JOB_ESTIMATE_CACHE_SECONDS", "5"))
+_estimate_lock = threading.Lock()
+# job id -> (status, computed at (monotonic), estimate)
+_estimates: Dict[str, Tuple[JobStatus, float, Optional[datetime]]] = {}
+
+
+# estimate_finish_at, computed again only once the job changes status or the last
+# estimate is older than JOB_ESTIMATE_CACHE_SECONDS
+def cached_finish_at(job: TranscriptionJob) -> Optional[datetime]:
+    now = time.monotonic()
+    with _estimate_lock:
+        cached = _estimates.get(job.id)
+    if cached and cached[0] == job.status and now - cached[1] < JOB_ESTIMATE_CACHE_SECONDS:
+        return cached[2]
+
+    finish_at = estimate_finish_at(job)
+    with _estimate_lock:
+        _estimates[job.id] = (job.status, now, finish_at)
+        if len(_estimates) > JOB_STORE_MAX_ENTRIES:
+            for job_id in [k for k, v in _estimates.items() if now - v[1] >= JOB_ESTIMATE_CACHE_SECONDS]:
+                del _estimates[job_id]
+    return finish_at
+
+
+# Writes to a processing job only land while `worker_id` still owns it. A job requeued
+# as stale (and maybe claimed by another worker) is left alone. Returns whether it landed.
+def _update_owned_job(job_id: str, worker_id: str, **values) -> bool:
+    with Session(job_engine) as session:
+        updated = session.execute(
+            update(TranscriptionJob)
+            .where(
+                TranscriptionJob.id == job_id,
+                TranscriptionJob.status == JobStatus.PROCESSING,
+                TranscriptionJob.worker_id == worker_id,
+            )
+            .values(updated_at=datetime.utcnow(), **values)
+        )
+        session.commit()
+    return updated.rowcount == 1
+
+
+# To tell the supervisor the job's worker is still alive
+def heartbeat_job(job_id: str, worker_id: str) -> bool:
+    return _update_owned_job(job_id, worker_id)
+
+
+# To publish how far a job has got, read by the status endpoints (long-poll and SSE)
+def update_job_progress(job_id: str, worker_id: str, progress: Dict[str, Any]) -> bool:
+    return _update_owned_job(job_id, worker_id, progress=progress)
+
+
+def complete_job(job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+    result, result_path = _store_result(job_id, result)
+    return _update_owned_job(
+        job_id, worker_id, status=JobStatus.DONE, result=result, result_path=result_path,
+        progress=None, error=None, trace=None, finished_at=datetime.utcnow(),
+    )
+
+
+def fail_job(job_id: str, worker_id: str, error: str, trace: Optional[str] = None) -> bool:
+    if trace and len(trace) > JOB_TRACE_MAX_CHARS:
+        trace = "...\n" + trace[-JOB_TRACE_MAX_CHARS:]
+    return _update_owned_job(
+        job_id, worker_id, status=JobStatus.ERROR, result=None, progress=None,
+        error=error, trace=trace, finished_at=datetime.utcnow(),
+    )
+
+
+# To put jobs orphaned by a crashed/restarted worker back on the queue (or fail them
+# once they have used up their attempts). Returns how many jobs were touched.
+def requeue_stale_jobs() -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    stale = (
+        (TranscriptionJob.status == JobStatus.PROCESSING)
+        & (TranscriptionJob.updated_at < cutoff)
+    )
+    with Session(job_engine) as session:
+        requeued = session.execute(
+            update(TranscriptionJob)
+            .where(stale, TranscriptionJob.attempts < JOB_MAX_ATTEMPTS)
+            .values(status=JobStatus.QUEUED, worker_id=None, progress=None, updated_at=datetime.utcnow())
+        )
+        failed = session.execute(
+            update(TranscriptionJob)
+            .where(stale)
+            .values(
+                status=JobStatus.ERROR,
+                error="Transcription worker stopped before the job finished",
+                finished_at=datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+            )
+        )
+        session.commit()
+        return requeued.rowcount + failed.rowcount
+
+
+def _expire_jobs(session: Session, condition, limit: Optional[int] = None) -> int:
+    query = select(TranscriptionJob.id, TranscriptionJob.result_path).where(
+        TranscriptionJob.status.in_(JOB_FINISHED), condition
+    )
+    if limit is not None:
+        query = query.order_by(
+            func.coalesce(TranscriptionJob.accessed_at, TranscriptionJob.finished_at)
+        ).limit(limit)
+    rows = session.exec(query).all()
+    if not rows:
+        return 0
+    session.execute(
+        update(TranscriptionJob)
+        .where(TranscriptionJob.id.in_([row.id for row in rows]), TranscriptionJob.status.in_(JOB_FINISHED))
+        .values(
+            status=JobStatus.EXPIRED,
+            result=None,
+            result_path=None,
+            error=None,
+            trace=None,
+            updated_at=datetime.utcnow(),
+        )
+    )
+    session.commit()
+    _remove_result_files(row.result_path for row in rows)
+    return len(rows)
+
+
+# To bound the job store: expire finished jobs past their TTL, then the least recently
+# fetched ones above JOB_STORE_MAX_ENTRIES, and drop old tombstones.
+def sweep_jobs() -> Dict[str, int]:
+    now = datetime.utcnow()
+    last_used = func.coalesce(TranscriptionJob.accessed_at, TranscriptionJob.finished_at)
+    with Session(job_engine) as session:
+        expired = _expire_jobs(session, last_used < now - timedelta(seconds=JOB_RESULT_TTL_SECONDS))
+
+        finished = session.exec(
+            select(func.count()).select_from(TranscriptionJob).where(TranscriptionJob.status.in_(JOB_FINISHED))
+        ).one()
+        evicted = 0
+        if finished > JOB_STORE_MAX_ENTRIES:
+            evicted = _expire_jobs(session, true(), limit=finished - JOB_STORE_MAX_ENTRIES)
+
+        removed = session.execute(
+            delete(TranscriptionJob).where(
+                TranscriptionJob.status == JobStatus.EXPIRED,
+                TranscriptionJob.updated_at < now - timedelta(seconds=JOB_TOMBSTONE_SECONDS),
+            )
+        ).rowcount
+        # Rows of workers that were killed without a clean shutdown
+        session.execute(delete(TranscriptionWorker).where(TranscriptionWorker.seen_at < now - timedelta(days=1)))
+        session.commit()
+
+    metrics.inc("job_store_expired", expired)
+    metrics.inc("job_store_evicted", evicted)
+    metrics.inc("job_store_tombstones_removed", removed)
+    stats = job_store_stats()
+    for name, value in stats.items():
+        metrics.set_gauge(f"job_store_{name}", value)
+    return {"expired": expired, "evicted": evicted, "tombstones_removed": removed}
+
+
+def job_store_stats() -> Dict[str, int]:
+    with Session(job_engine) as session:
+        counts = dict(session.exec(
+            select(TranscriptionJob.status, func.count()).group_by(TranscriptionJob.status)
+        ).all())
+        spilled = session.exec(
+            select(func.count()).select_from(TranscriptionJob).where(TranscriptionJob.result_path.is_not(None))
+        ).one()
+
+    spill_bytes = 0
+    if os.path.isdir(JOB_RESULT_DIR):
+        for entry in os.scandir(JOB_RESULT_DIR):
+            try:
+                spill_bytes += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+
+    stats = {f"jobs_{status.value}": counts.get(status, 0) for status in JobStatus}
+    stats["jobs_total"] = sum(counts.values())
+    stats["results_spilled"] = spilled
+    stats["spill_bytes"] = spill_bytes
+    return stats
@@ -0,0 +1,138 @@
+import os
+import threading
+from typing import Dict, List, Optional
+import ffmpeg
+import numpy as np
+from config.pipeline import WHISPER_LIVE_MODEL
+from utils.transcribe import SAMPLE_RATE, PcmBuffer, _transcribe_window, drain_stderr, stderr_text
+from utils.whisper_models import get_model
+from utils.bible_refs import StreamingReferenceDetector
+
+# Audio kept for one transcription pass, and how much new audio triggers the next pass
+LIVE_WINDOW_SECONDS = float(os.getenv("LIVE_WINDOW_SECONDS", "30"))
+LIVE_STEP_SECONDS = float(os.getenv("LIVE_STEP_SECONDS", "5"))
+
+
+class LiveTranscriber:
+    """Incremental transcription of audio that arrives in chunks while it is recorded.
+
+    Chunks (e.g. webm/opus from MediaRecorder) are written to a long running ffmpeg
+    process that decodes them to 16 kHz PCM. Whisper runs over a sliding window of
+    that PCM. A segment is committed once there is enough audio after it to be sure
+    it is complete. The rest stays in the window and is transcribed again on the next
+    pass. step() and finish() return events for the client: committed "segment"s and
+    newly detected bible "reference"s.
+    """
+
+    def __init__(self, input_format: Optional[str] = None):
+        self._input_format = input_format
+        self._proc = None
+        self._reader: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pending = bytearray()  # decoded PCM not yet moved into the window
+        self._buf = PcmBuffer(int(LIVE_WINDOW_SECONDS * SAMPLE_RATE))
+        self._offset_samples = 0
+        self._language = None
+        self._sent_refs = 0
+        self.detector = StreamingReferenceDetector()
+        self.parts: List[str] = []
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(self.parts).strip()
+
+    @property
+    def duration(self) -> float:
+        return (self._offset_samples + len(self._buf)) / SAMPLE_RATE
+
+    def start(self):
+        input_args = {"format": self._input_format} if self._input_format else {}
+        self._proc = (
+            ffmpeg
+            .input("pipe:0", **input_args)
+            .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=str(SAMPLE_RATE))
+            .global_args("-loglevel", "error")
+            .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+        )
+        # Unread error output would block ffmpeg, and then feed() on its stdin
+        drain_stderr(self._proc)
+        self._reader = threading.Thread(target=self._read_pcm, name="live-pcm-reader", daemon=True)
+        self._reader.start()
+
+    def _read_pcm(self):
+        # To drain ffmpeg's stdout continuously so writing to its stdin never blocks
+        while True:
+            data = self._proc.stdout.read1(64 * 1024)
+            if not data:
+                break
+            with self._lock:
+                self._pending.extend(data)
+
+    def feed(self, chunk: bytes):
+        self._proc.stdin.write(chunk)
+        self._proc.stdin.flush()
+
+    def ready(self) -> bool:
+        with self._lock:
+            return len(self._pending) >= LIVE_STEP_SECONDS * SAMPLE_RATE * 2
+
+    def _pull(self) -> bool:
+        # To move decoded PCM into the window, returns True when nothing is left pending
+        with self._lock:
+            n = min(len(self._pending) // 2, self._buf.free)
+            data = bytes(self._pending[:n * 2])
+            del self._pending[:n * 2]
+            drained = len(self._pending) < 2
+        if n:
+            self._buf.write(np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0)
+        return drained
+
+    def step(self, final: bool = False) -> List[Dict]:
+        events: List[Dict] = []
+        model = get_model(WHISPER_LIVE_MODEL)
+        while True:
+            drained = self._pull()
+            if not len(self._buf):
+                break
+            last = final and drained
+            segments, consumed, self._language = _transcribe_window(
+                model,
+                self._buf.view(),
+                self._offset_samples / SAMPLE_RATE,
+                final=last,
+                language=self._language,
+                can_wait=self._buf.free > 0,
+            )
+            self._buf.consume(consumed)
+            self._offset_samples += consumed
+            for segment in segments:
+                self.parts.append(segment.text)
+                self.detector.feed(segment.text, segment.start, segment.end)
+                events.append({"type": "segment", **segment._asdict()})
+            events.extend(self._new_references())
+            # Live passes run once per step, the final pass runs until all audio is used
+            if not final or last:
+                break
+        return events
+
+    def finish(self) -> List[Dict]:
+        self._proc.stdin.close()
+        self._reader.join()
+        self._proc.wait()
+        if self._proc.returncode != 0:
+            error_msg = stderr_text(self._proc) or "Unknown ffmpeg error"
+            raise RuntimeError(f"FFMPEG failed: {error_msg}")
+        events = self.step(final=True)
+        self.detector.finish()
+        events.extend(self._new_references())
+        return events
+
+    def _new_references(self) -> List[Dict]:
+        new = self.detector.references[self._sent_refs:]
+        self._sent_refs = len(self.detector.references)
+        return [{"type": "reference", **ref} for ref in new]
+
+    def close(self):
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
@@ -0,0 +1,246 @@
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from utils.tokens import count_tokens
+from utils import metrics
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Retries for rate limits, timeouts, dropped connections and 5xx, with exponential
+# backoff and full jitter (a Retry-After header from the server wins when it is longer)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Org wide limits (requests and tokens per minute), 0 turns a limit off. Every process
+# that calls the API takes an equal share, LLM_PROCESSES defaults to the worker count.
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+LLM_PROCESSES = int(os.getenv("LLM_PROCESSES") or os.getenv("TRANSCRIBE_WORKERS", "1"))
+
+# Connections kept open to the API, shared by every call in the process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+
+# One pooled HTTP client for the whole process, retries are done here (not by the SDK)
+# so they can respect the limiter. OPENAI_BASE_URL can point at scripts/fake_openai.py.
+client = OpenAI(
+    api_key=OPENAI_API_KEY,
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    max_retries=0,
+    http_client=httpx.Client(
+        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+    ),
+)
+
+
+class TokenBucket:
+    """Allows `rate` units per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        # A single request bigger than the whole bucket only has to wait for a full one
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class TokenUsage:
+    """Prompt, cached prompt and completion tokens added up over the calls of one job."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.prompt_tokens
+            self.cached_tokens += getattr(details, "cached_tokens", None) or 0
+            self.completion_tokens += usage.completion_tokens
+
+    def __str__(self):
+        return (
+            f"{self.calls} calls, {self.prompt_tokens} prompt tokens ({self.cached_tokens} cached), "
+            f"{self.completion_tokens} completion tokens"
+        )
+
+
+def _bucket(per_minute: int) -> Optional[TokenBucket]:
+    if per_minute <= 0:
+        return None
+    share = per_minute / max(1, LLM_PROCESSES)
+    # Up to a tenth of the minute's budget can go out at once
+    return TokenBucket(rate=share / 60, capacity=max(1, share / 10))
+
+
+_requests_bucket = _bucket(LLM_RPM)
+_tokens_bucket = _bucket(LLM_TPM)
+
+_RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# To call chat completions through the shared limiter, retrying transient failures.
+# Returns the response, raises the last error once the retries are used up.
+# Token counts are added to `usage` when given, for per job accounting.
+def chat_completion(
+    messages: List[Dict[str, str]],
+    model: str,
+    max_tokens: int,
+    temperature: float = 0.2,
+    timeout: Optional[float] = None,
+    usage: Optional[TokenUsage] = None,
+    **kwargs,
+):
+    prompt_tokens = sum(count_tokens(m["content"], model) for m in messages)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if _requests_bucket:
+            _requests_bucket.acquire()
+        if _tokens_bucket:
+            _tokens_bucket.acquire(prompt_tokens + max_tokens)
+
+        start = time.perf_counter()
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                **kwargs,
+            )
+        except _RETRYABLE as e:
+            metrics.inc("llm_errors")
+            if isinstance(e, RateLimitError):
+                metrics.inc("llm_rate_limited")
+            # An exhausted quota (also a 429) won't recover by waiting
+            if attempt == LLM_MAX_RETRIES or getattr(e, "code", None) == "insufficient_quota":
+                raise
+            delay = _backoff(attempt, e)
+            metrics.inc("llm_retries")
+            print(f"OpenAI call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        metrics.observe("llm_call_seconds", time.perf_counter() - start)
+        metrics.inc("llm_calls")
+        if response.usage:
+            details = getattr(response.usage, "prompt_tokens_details", None)
+            metrics.inc("llm_prompt_tokens", response.usage.prompt_tokens)
+            metrics.inc("llm_cached_tokens", getattr(details, "cached_tokens", None) or 0)
+            metrics.inc("llm_completion_tokens", response.usage.completion_tokens)
+            if usage is not None:
+                usage.add(response.usage)
+        return response
+
+
+# To stream a chat completion, yielding the text as it arrives. Failures before the
+# first text are retried like chat_completion; after that the caller has already used
+# part of the answer, so the error is raised.
+def stream_chat_completion(
+    messages: List[Dict[str, str]],
+    model: str,
+    max_tokens: int,
+    temperature: float = 0.2,
+    timeout: Optional[float] = None,
+    usage: Optional[TokenUsage] = None,
+    **kwargs,
+) -> Iterator[str]:
+    prompt_tokens = sum(count_tokens(m["content"], model) for m in messages)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if _requests_bucket:
+            _requests_bucket.acquire()
+        if _tokens_bucket:
+            _tokens_bucket.acquire(prompt_tokens + max_tokens)
+
+        start = time.perf_counter()
+        started = False
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs,
+            )
+            for chunk in stream:
+                # The last chunk has no choices, only the usage
+                if chunk.usage:
+                    details = getattr(chunk.usage, "prompt_tokens_details", None)
+                    metrics.inc("llm_prompt_tokens", chunk.usage.prompt_tokens)
+                    metrics.inc("llm_cached_tokens", getattr(details, "cached_tokens", None) or 0)
+                    metrics.inc("llm_completion_tokens", chunk.usage.completion_tokens)
+                    if usage is not None:
+                        usage.add(chunk.usage)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if not started:
+                    started = True
+                    metrics.observe("llm_first_token_seconds", time.perf_counter() - start)
+                yield chunk.choices[0].delta.content
+        except _RETRYABLE as e:
+            metrics.inc("llm_errors")
+            if isinstance(e, RateLimitError):
+                metrics.inc("llm_rate_limited")
+            if started or attempt == LLM_MAX_RETRIES or getattr(e, "code", None) == "insufficient_quota":
+                raise
+            delay = _backoff(attempt, e)
+            metrics.inc("llm_retries")
+            print(f"OpenAI stream failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        metrics.observe("llm_call_seconds", time.perf_counter() - start)
+        metrics.inc("llm_calls")
+        return
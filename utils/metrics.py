@@ -0,0 +1,77 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Any, List
+
+# In-process counters and gauges, served as JSON on GET /metrics.
+# Each process (API worker, transcription worker) keeps its own values. Transcription
+# workers publish theirs with export() on their heartbeat, the API merges them.
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+# Latest observations per name, percentiles are computed over this window
+_samples: Dict[str, Deque[float]] = {}
+SAMPLE_WINDOW = 1000
+
+
+def inc(name: str, value: float = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    with _lock:
+        _samples.setdefault(name, deque(maxlen=SAMPLE_WINDOW)).append(value)
+
+
+def _percentile(ordered, pct: float) -> float:
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize_samples(values) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50": round(_percentile(ordered, 50), 3),
+        "p95": round(_percentile(ordered, 95), 3),
+    }
+
+
+# The raw values of this process, JSON-serializable
+def export() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "samples": {name: list(values) for name, values in _samples.items() if values},
+        }
+
+
+def _summarize(raw: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "counters": raw["counters"],
+        "gauges": raw["gauges"],
+        "latencies": {name: summarize_samples(values) for name, values in raw["samples"].items()},
+    }
+
+
+# To combine the exports of several processes: counters and gauges are summed,
+# percentiles are computed over all of their samples
+def merge(exports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {"counters": {}, "gauges": {}, "samples": {}}
+    for raw in exports:
+        for kind in ("counters", "gauges"):
+            for name, value in raw.get(kind, {}).items():
+                merged[kind][name] = merged[kind].get(name, 0) + value
+        for name, values in raw.get("samples", {}).items():
+            merged["samples"].setdefault(name, []).extend(values)
+    return _summarize(merged)
+
+
+def snapshot() -> Dict[str, Any]:
+    return _summarize(export())
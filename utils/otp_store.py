@@ -1,22 +1,181 @@
+import heapq
+import hashlib
+import hmac
+import math
+import os
+import threading
 import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import SQLModel, Session, select
+from config.db import engine
+from models.otp_code import OtpCode
+from utils.security import SECRET_KEY
 
-otp_store = {}
+load_dotenv()
+
+# "sql" keeps codes in the otp_codes table, shared by every worker process.
+# "memory" is per process, only for a single worker (or local development).
+OTP_BACKEND = os.getenv("OTP_BACKEND", "sql")
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "600"))
+# Wrong guesses allowed per code before it stops working
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+# Codes sent per email within the window
+OTP_SEND_LIMIT = int(os.getenv("OTP_SEND_LIMIT", "3"))
+OTP_SEND_WINDOW_SECONDS = int(os.getenv("OTP_SEND_WINDOW_SECONDS", "900"))
+
+
+# Codes are stored keyed, a leaked store doesn't hand out working codes
+def _digest(email: str, otp: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"{email}:{otp}".encode(), hashlib.sha256).hexdigest()
+
+
+class MemoryOtpBackend:
+    """Dict of records plus a min-heap of expiry times, so a sweep only touches expired entries."""
+
+    def __init__(self):
+        self._records: Dict[str, dict] = {}
+        self._expiry: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def set(self, email: str, otp: str, ttl_seconds: int) -> Optional[int]:
+        now = time.time()
+        with self._lock:
+            record = self._records.get(email)
+            if record is None or record["window_start"] + OTP_SEND_WINDOW_SECONDS <= now:
+                record = {"window_start": now, "sends": 0}
+            elif record["sends"] >= OTP_SEND_LIMIT:
+                return math.ceil(record["window_start"] + OTP_SEND_WINDOW_SECONDS - now)
+            record.update(code_hash=_digest(email, otp), expires_at=now + ttl_seconds, attempts=0)
+            record["sends"] += 1
+            self._records[email] = record
+            # The record is needed until both the code and the send window are over
+            heapq.heappush(self._expiry, (self._drop_at(record), email))
+        return None
+
+    def verify(self, email: str, otp: str) -> bool:
+        with self._lock:
+            record = self._records.get(email)
+            if not record or not record["code_hash"] or record["expires_at"] <= time.time():
+                return False
+            if record["attempts"] >= OTP_MAX_ATTEMPTS:
+                return False
+            record["attempts"] += 1
+            if not hmac.compare_digest(record["code_hash"], _digest(email, otp)):
+                return False
+            record["code_hash"] = None
+            return True
+
+    def sweep(self) -> int:
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                drop_at, email = heapq.heappop(self._expiry)
+                record = self._records.get(email)
+                # Stale heap entries (the email got a newer code) are skipped
+                if record is not None and self._drop_at(record) == drop_at:
+                    del self._records[email]
+                    removed += 1
+        return removed
+
+    @staticmethod
+    def _drop_at(record: dict) -> float:
+        return max(record["expires_at"], record["window_start"] + OTP_SEND_WINDOW_SECONDS)
+
+
+class SqlOtpBackend:
+    """otp_codes rows keyed by email, every change is one conditional statement so
+    concurrent workers can't double send past the limit or reuse a code."""
+
+    def create_table(self):
+        SQLModel.metadata.create_all(engine, tables=[OtpCode.__table__])
+
+    def set(self, email: str, otp: str, ttl_seconds: int) -> Optional[int]:
+        now = datetime.utcnow()
+        window_over = now - timedelta(seconds=OTP_SEND_WINDOW_SECONDS)
+        table = OtpCode.__table__
+        dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(table).values(
+            email=email, code_hash=_digest(email, otp), expires_at=now + timedelta(seconds=ttl_seconds),
+            attempts=0, window_start=now, sends=1,
+        )
+        new_window = table.c.window_start <= window_over
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.email],
+            set_={
+                "code_hash": stmt.excluded.code_hash,
+                "expires_at": stmt.excluded.expires_at,
+                "attempts": 0,
+                "window_start": case((new_window, stmt.excluded.window_start), else_=table.c.window_start),
+                "sends": case((new_window, 1), else_=table.c.sends + 1),
+            },
+            # Nothing is written when the email is over its limit
+            where=new_window | (table.c.sends < OTP_SEND_LIMIT),
+        ).returning(table.c.email)
+        with engine.begin() as conn:
+            if conn.execute(stmt).first() is not None:
+                return None
+            window_start = conn.execute(select(table.c.window_start).where(table.c.email == email)).scalar()
+        return max(1, math.ceil((window_start - window_over).total_seconds()))
+
+    def verify(self, email: str, otp: str) -> bool:
+        table = OtpCode.__table__
+        with engine.begin() as conn:
+            # Counts the attempt first, a guess past the limit never gets compared
+            code_hash = conn.execute(
+                update(table)
+                .where(
+                    table.c.email == email,
+                    table.c.code_hash.is_not(None),
+                    table.c.expires_at > datetime.utcnow(),
+                    table.c.attempts < OTP_MAX_ATTEMPTS,
+                )
+                .values(attempts=table.c.attempts + 1)
+                .returning(table.c.code_hash)
+            ).scalar()
+            if code_hash is None or not hmac.compare_digest(code_hash, _digest(email, otp)):
+                return False
+            # Only one of two concurrent correct guesses uses the code
+            used = conn.execute(
+                update(table)
+                .where(table.c.email == email, table.c.code_hash == code_hash)
+                .values(code_hash=None)
+            )
+            return used.rowcount == 1
+
+    def sweep(self) -> int:
+        now = datetime.utcnow()
+        table = OtpCode.__table__
+        with engine.begin() as conn:
+            result = conn.execute(delete(table).where(
+                table.c.expires_at <= now,
+                table.c.window_start <= now - timedelta(seconds=OTP_SEND_WINDOW_SECONDS),
+            ))
+        return result.rowcount
+
+
+_backend = SqlOtpBackend() if OTP_BACKEND == "sql" else MemoryOtpBackend()
+
+
+def create_otp_table():
+    if isinstance(_backend, SqlOtpBackend):
+        _backend.create_table()
+
+
+# Stores a new code for the email, replacing any earlier one. Returns None, or the
+# seconds to wait when the email already got OTP_SEND_LIMIT codes in the window.
+def set_otp(email: str, otp: str, ttl_seconds: int = OTP_TTL_SECONDS) -> Optional[int]:
+    return _backend.set(email, otp, ttl_seconds)
 
-def set_otp(email: str, otp: str, ttl_seconds: int = 600):
-    expiry = time.time() + ttl_seconds
-    otp_store[email] = {
-        "otp": otp,
-        "expires_at": expiry,
-    }
 
 def verify_otp(email: str, otp: str) -> bool:
-    record = otp_store.get(email)
-    if not record:
-        return False
-    if time.time() > record["expires_at"]:
-        del otp_store[email]
-        return False
-    if record["otp"] != otp:
-        return False
-    del otp_store[email]
-    return True
\ No newline at end of file
+    return _backend.verify(email, otp)
+
+
+# To drop expired codes whose send window is over too, returns how many were removed
+def sweep_otps() -> int:
+    return _backend.sweep()
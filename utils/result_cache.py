@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+import tempfile
+from typing import Optional, Dict, Any
+from dotenv import load_dotenv
+from config.pipeline import pipeline_fingerprint
+
+load_dotenv()
+
+# Finished results (transcript, summary, bible references) keyed by the SHA-256 of the
+# uploaded audio, so a re-uploaded recording skips Whisper and OpenAI entirely.
+# The directory must be shared by the API and the workers, like UPLOAD_DIR.
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "gospelnote-results")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+
+def cache_key(audio_hash: str) -> str:
+    # The pipeline settings are part of the key, a model change must not serve old notes
+    return f"{audio_hash}-{pipeline_fingerprint()}"
+
+
+def _entry_path(audio_hash: str) -> str:
+    return os.path.join(RESULT_CACHE_DIR, f"{cache_key(audio_hash)}.json")
+
+
+def get_cached_result(audio_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not RESULT_CACHE_ENABLED or not audio_hash:
+        return None
+    path = _entry_path(audio_hash)
+    try:
+        with open(path) as f:
+            result = json.load(f)
+        # To mark the entry as recently used for LRU eviction
+        os.utime(path)
+        return result
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def put_cached_result(audio_hash: Optional[str], result: Dict[str, Any]):
+    if not RESULT_CACHE_ENABLED or not audio_hash:
+        return
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    # Write then rename, so readers never see a half written entry
+    fd, tmp_path = tempfile.mkstemp(dir=RESULT_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp_path, _entry_path(audio_hash))
+    _evict()
+
+
+# To drop least recently used entries until the cache fits in RESULT_CACHE_MAX_MB
+def _evict():
+    entries = []
+    total = 0
+    for entry in os.scandir(RESULT_CACHE_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= RESULT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
@@ -1,8 +1,9 @@
 from passlib.context import CryptContext
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
-from sympy.utilities.decorator import deprecated
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from jose import jwt
+import asyncio
 import os
 import secrets
 import hashlib
@@ -14,8 +15,14 @@ RESET_TOKEN_EXPIRY_SECONDS = 3600 # 1 hour
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 300
+# bcrypt cost factor, each +1 doubles the time per hash (existing hashes keep their own cost)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads for hashing, a login burst queues here instead of filling the shared threadpool
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+
 # Set up to hash password
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -38,6 +45,15 @@ def verify_password(password: str, hashed_password: str) -> bool:
     normalized = hashlib.sha256(password.encode()).hexdigest()
     return pwd_context.verify(normalized, hashed_password)
 
+# For async routes, bcrypt runs on its own executor and the event loop stays free
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_bcrypt_executor, hash_password, password)
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(
+        _bcrypt_executor, verify_password, password, hashed_password
+    )
+
 def generate_access_token(email: str):
    serializer = URLSafeTimedSerializer(SECRET_KEY)
    return serializer.dumps(email)
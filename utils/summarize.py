@@ -1,20 +1,46 @@
 import math
 import re
 import os
-from typing import List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
 from dotenv import load_dotenv
-from openai import OpenAI, BadRequestError, RateLimitError
+from openai import BadRequestError, RateLimitError
+from config.pipeline import SUMMARY_MODEL
+from utils.tokens import count_tokens
+from utils.llm import TokenUsage, chat_completion, stream_chat_completion
+from utils import metrics
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-# To ensure 4 chars per token heuristic
-
-
-def _approx_tokens(text: str) -> int:
-    return max(1, math.ceil(len(text) / 4))
+# How many chunk summaries may be in flight at once for one sermon
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+# Token budget of the bullet lists merged by a single reduce call
+REDUCE_BATCH_TOKENS = int(os.getenv("SUMMARY_REDUCE_BATCH_TOKENS", "3000"))
+# Per request timeout in seconds, so one stuck call can't hold the whole job
+SUMMARY_CALL_TIMEOUT = float(os.getenv("SUMMARY_CALL_TIMEOUT", "60"))
+# Transcript tokens sent to a single map call, and sentences repeated at the start of the
+# next chunk so a thought cut at the boundary is seen whole by one of the calls
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+SUMMARY_CHUNK_OVERLAP = int(os.getenv("SUMMARY_CHUNK_OVERLAP_SENTENCES", "2"))
+# Adaptive chunking uses the fewest chunks that fit and sizes them evenly, instead of
+# filling every chunk to the budget and leaving a small remainder for the last one
+SUMMARY_ADAPTIVE_CHUNKS = os.getenv("SUMMARY_ADAPTIVE_CHUNKS", "1") == "1"
+# Transcripts up to this many tokens are summarized by one request, no map/reduce at all
+SUMMARY_SINGLE_PASS_TOKENS = int(os.getenv("SUMMARY_SINGLE_PASS_TOKENS", "12000"))
+# Off, every summary gets a reduce call even for a single partial (for comparisons)
+SUMMARY_FAST_PATH = os.getenv("SUMMARY_FAST_PATH", "1") == "1"
+# Stream completions so bullets reach the job status while the model is still writing
+SUMMARY_STREAM = os.getenv("SUMMARY_STREAM", "1") == "1"
+
+# Transcript sizes latencies are reported by, in tokens
+LATENCY_BUCKETS = [(2000, "<2k"), (6000, "2k-6k"), (12000, "6k-12k"), (24000, "12k-24k")]
+
+
+# A piece of a sentence too long for one chunk, see _split_long_sentences
+class _WordRun(str):
+    pass
 
 
 def _split_into_sentences(text: str) -> List[str]:
@@ -27,156 +53,212 @@ def _split_into_sentences(text: str) -> List[str]:
     return [p.strip() for p in parts if p.strip()]
 
 
-def _group_by_tokens(sentences: List[str], max_tokens: int, overlap: int = 0) -> List[str]:
+def _group_by_tokens(
+    sentences: List[str],
+    max_tokens: int,
+    overlap: int = 0,
+    sep: str = " ",
+    min_group: int = 1,
+) -> List[str]:
     chunks, cur, budget = [], [], 0
     for s in sentences:
-        t = _approx_tokens(s)
-        if budget + t > max_tokens and cur:
-            chunks.append(" ".join(cur))
-            # To keep small overlap to avoid cutting thoughts mid-sentence
-            if overlap > 0:
-                cur = cur[-overlap:]
-                budget = _approx_tokens(" ".join(cur))
-            else:
-                cur, budget = [], 0
+        t = count_tokens(s)
+        # min_group lets the reducer insist on merging at least two lists per call
+        if budget + t > max_tokens and len(cur) >= min_group:
+            chunks.append(sep.join(cur))
+            # To keep small overlap to avoid cutting thoughts mid-sentence. Word runs are
+            # already cut mid-thought and are budget sized, they are never repeated, and
+            # overlap sentences are dropped until the next one still fits the budget.
+            cur = [] if overlap <= 0 or isinstance(s, _WordRun) else cur[-overlap:]
+            runs = [i for i, c in enumerate(cur) if isinstance(c, _WordRun)]
+            if runs:
+                cur = cur[runs[-1] + 1:]
+            while cur and count_tokens(sep.join(cur)) + t > max_tokens:
+                cur.pop(0)
+            budget = count_tokens(sep.join(cur)) if cur else 0
         cur.append(s)
         budget += t
     if cur:
         # The final chunk
-        chunks.append(" ".join(cur))
+        chunks.append(sep.join(cur))
     return chunks
 
 # PROMPTS
-# The System prompt
-SYS = (
-    "You produce concise, accurate sermon notes. With no fluff. "
-    "Never invent facts or verses not in the transcript."
-)
-
-# The Map prompt, applied to each chunk
-MAP_USER_TMPL = """
-You are a gospel sermon note writer and summarizer.
-
-INSTRUCTIONS:
-- Use only the transcript content; do not improvise.
-- Extract key points from the sermon.
+# Everything static lives in the system prompts, byte-identical on every call, and the
+# variable data (part number, transcript, bullets) goes last in the user message. The
+# provider can then reuse the cached prefix across chunks, levels and sermons.
+# The shared rules, both stages start with these
+SYS = """You produce concise, accurate gospel sermon notes, with no fluff.
+- Use only the given content; never invent facts or verses.
 - Write in expressive bullet style, e.g., “The way of the Lord is… (Genesis 1:1)”.
-- If Bible verses are mentioned, include them after the point.
+- Put Bible verses after the point they support; do NOT add verses if none are mentioned.
 - Normalize spoken verse formats, e.g., “John chapter 3 verse to 5” -> “John 3:2–5”.
-- Do NOT add verses if none are mentioned.
 - Include headings/subheadings where clearly implied.
-- If this is not a sermon, say exactly: “This is not a sermon.”
-
-TRANSCRIPT (Part {part} of {total}):
-{chunk}
+"""
 
-Summarize now into 5–10 clear bullets (with no intro/outro).
+# The Map prompt, applied to each chunk
+MAP_SYS = SYS + """
+TASK: You get one part of a sermon transcript. Extract its key points as 5–10 clear bullets, with no intro/outro.
+If this is not a sermon, say exactly: “This is not a sermon.”
 """
+MAP_USER_TMPL = "TRANSCRIPT (Part {part} of {total}):\n{chunk}"
 
 # To reduce prompt, and merge partial bullet lists
-REDUCE_USER_TMPL = """
-You are a gospel sermon note writer.
-
-Here are partial bullet lists from multiple transcript chunks:
-
-{bullets}
-
-Please merge them into a single, non-redundant set of bullets:
-- Keep all distinct key points.
-- Remove duplicates and overlaps.
-- Preserve Bible verses and normalized references.
-- Keep headings/subheadings if present.
-- Maintain the concise expressive style.
+REDUCE_SYS = SYS + """
+TASK: You get partial bullet lists from multiple transcript chunks. Merge them into a single, non-redundant set of bullets:
+- Keep all distinct key points; remove duplicates and overlaps.
+- Preserve Bible verses, normalized references and headings.
 """
-
-# To splits on paragraph/sentence-ish boundaries to stay under model limits.
-def _split_transcript(text: str, max_chars: int = 3500) -> List[str]:
-    # To normalize newlines
-    text = re.sub(r"\r\n?", "\n", text).strip()
-
-    # To prefer paragraph splits, then sentences
-    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
-
-    chunks: List[str] = []
-    buf = []
-
-    def flush():
-        if buf:
-            chunks.append("\n".join(buf).strip())
-
-    current_len = 0
-    for p in paragraphs:
-        if len(p) > max_chars:  # very long paragraph -> sentence split
-            # For naive sentence split
-            sentences = re.split(r"(?<=[\.\!\?])\s+", p)
-            for s in sentences:
-                if current_len + len(s) + 1 > max_chars:
-                    flush()
-                    buf.clear()
-                    current_len = 0
-                buf.append(s)
-                current_len += len(s) + 1
+REDUCE_USER_TMPL = "PARTIAL BULLET LISTS:\n{bullets}"
+
+# Sent with every summary call so the provider routes them to the same prompt cache, empty turns it off
+SUMMARY_PROMPT_CACHE_KEY = os.getenv("SUMMARY_PROMPT_CACHE_KEY", "sermon-notes")
+
+
+def _cache_options(stage: str) -> dict:
+    return {"prompt_cache_key": f"{SUMMARY_PROMPT_CACHE_KEY}-{stage}"} if SUMMARY_PROMPT_CACHE_KEY else {}
+
+
+def map_messages(chunk: str, part: int, total: int) -> List[dict]:
+    return [
+        {"role": "system", "content": MAP_SYS},
+        {"role": "user", "content": MAP_USER_TMPL.format(chunk=chunk, part=part, total=total)},
+    ]
+
+
+def reduce_messages(bullets: str) -> List[dict]:
+    return [
+        {"role": "system", "content": REDUCE_SYS},
+        {"role": "user", "content": REDUCE_USER_TMPL.format(bullets=bullets)},
+    ]
+
+# A single sentence over the budget (e.g. an unpunctuated transcript) is cut into word runs
+def _split_long_sentences(sentences: List[str], max_tokens: int) -> List[str]:
+    out: List[str] = []
+    for sentence in sentences:
+        if count_tokens(sentence) <= max_tokens:
+            out.append(sentence)
+            continue
+        words = sentence.split(" ")
+        out.extend(_WordRun(run) for run in _group_by_tokens(words, max_tokens=max_tokens))
+    return out
+
+
+# To split the transcript at sentence boundaries into chunks of at most max_tokens
+# (counted with the model's tokenizer), each starting with the last `overlap` sentences
+# of the previous chunk.
+def _chunk_transcript(
+    text: str,
+    max_tokens: int = SUMMARY_CHUNK_TOKENS,
+    overlap: int = SUMMARY_CHUNK_OVERLAP,
+    adaptive: bool = SUMMARY_ADAPTIVE_CHUNKS,
+) -> List[str]:
+    sentences = _split_long_sentences(_split_into_sentences(text), max_tokens)
+    if not sentences:
+        return []
+    total = sum(count_tokens(s) for s in sentences)
+    if total <= max_tokens:
+        return [" ".join(sentences)]
+    if not adaptive:
+        return _group_by_tokens(sentences, max_tokens=max_tokens, overlap=overlap)
+
+    # Filling every chunk to the budget gives the fewest chunks, then the smallest budget
+    # that still packs into that many evens out their sizes
+    chunks = _group_by_tokens(sentences, max_tokens=max_tokens, overlap=overlap)
+    low, high = math.ceil(total / len(chunks)), max_tokens
+    while low < high:
+        mid = (low + high) // 2
+        if len(_group_by_tokens(sentences, max_tokens=mid, overlap=overlap)) <= len(chunks):
+            high = mid
         else:
-            if current_len + len(p) + 1 > max_chars:
-                flush()
-                buf.clear()
-                current_len = 0
-            buf.append(p)
-            current_len += len(p) + 1
-
-    flush()
-    return chunks if chunks else [text]
-
-def _summarize_chunk(text: str, part: int, total: int, model: str = "gpt-4o-mini") -> List[str]:
+            low = mid + 1
+    return _group_by_tokens(sentences, max_tokens=low, overlap=overlap)
+
+
+class BulletParser:
+    """Turns streamed text into bullets as each line completes. Only the unfinished
+    last line is kept between deltas, text already parsed is never split again."""
+
+    def __init__(self):
+        self._line = ""
+        self.bullets: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        lines = (self._line + text).split("\n")
+        self._line = lines.pop()
+        return self._add(lines)
+
+    def finish(self) -> List[str]:
+        line, self._line = self._line, ""
+        return self._add([line])
+
+    def _add(self, lines: List[str]) -> List[str]:
+        new = [b for b in (re.sub(r"^[\-\*\•\s]+", "", line).strip() for line in lines) if b]
+        self.bullets.extend(new)
+        return new
+
+
+# To run one summary call and return its bullets. on_bullet(bullet) is called for each of
+# them, as soon as its line ends when streaming (SUMMARY_STREAM), else once the call returns.
+def _complete_bullets(
+    messages: List[dict],
+    max_tokens: int,
+    stage: str,
+    model: str = SUMMARY_MODEL,
+    usage: Optional[TokenUsage] = None,
+    on_bullet: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    options = dict(
+        model=model, temperature=0.2, max_tokens=max_tokens, timeout=SUMMARY_CALL_TIMEOUT,
+        messages=messages, usage=usage, **_cache_options(stage),
+    )
+    parser = BulletParser()
+    if on_bullet is None or not SUMMARY_STREAM:
+        resp = chat_completion(**options)
+        parser.feed((resp.choices[0].message.content or "").strip())
+        parser.finish()
+        for bullet in parser.bullets if on_bullet else []:
+            on_bullet(bullet)
+        return parser.bullets
+
+    for text in stream_chat_completion(**options):
+        for bullet in parser.feed(text):
+            on_bullet(bullet)
+    for bullet in parser.finish():
+        on_bullet(bullet)
+    return parser.bullets
+
+
+def _summarize_chunk(
+    text: str,
+    part: int,
+    total: int,
+    model: str = SUMMARY_MODEL,
+    usage: Optional[TokenUsage] = None,
+    on_bullet: Optional[Callable[[str], None]] = None,
+) -> List[str]:
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0.2,
-            max_tokens=600,
-            messages=[
-                {"role": "system", "content": SYS},
-                {"role": "user", "content": MAP_USER_TMPL.format(chunk=text, part=part, total=total)},
-            ],
-        )
-        content = (resp.choices[0].message.content or "").strip()
-        bullets = [
-            re.sub(r"^[\-\*\•\s]+", "", line).strip()
-            for line in content.splitlines()
-            if line.strip()
-        ]
-        return [b for b in bullets if b]
+        return _complete_bullets(map_messages(text, part, total), 600, "map", model, usage, on_bullet)
     except BadRequestError as e:
         # Surface the actual model error text if present
         msg = getattr(e, "message", str(e))
         raise RuntimeError(f"OpenAI BadRequest: {msg}")
     except RateLimitError:
+        # Only raised once chat_completion has used up its retries
         raise RuntimeError("OpenAI rate limit hit; please retry shortly.")
     except Exception as e:
         raise RuntimeError(f"Chunk summarization failed: {str(e)}")
 
-def _reduce_bullets(partials: List[str], model: str = "gpt-4o-mini") -> List[str]:
+def _reduce_bullets(
+    partials: List[str],
+    model: str = SUMMARY_MODEL,
+    usage: Optional[TokenUsage] = None,
+    on_bullet: Optional[Callable[[str], None]] = None,
+) -> List[str]:
     try:
-        # To join partial lists and keep it safely under a few thousand chars
+        # Callers batch the partials (see _tree_reduce) so this stays within budget
         joined = "\n\n".join(partials)
-        if len(joined) > 12000:  # To hard cap if you there are many long chunks
-            joined = joined[:12000]
-
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0.2,
-            max_tokens=800,
-            messages=[
-                {"role": "system", "content": SYS},
-                {"role": "user", "content": REDUCE_USER_TMPL.format(bullets=joined)},
-            ],
-        )
-        content = (resp.choices[0].message.content or "").strip()
-        bullets = [
-            re.sub(r"^[\-\*\•\s]+", "", line).strip()
-            for line in content.splitlines()
-            if line.strip()
-        ]
-        return [b for b in bullets if b]
+        return _complete_bullets(reduce_messages(joined), 800, "reduce", model, usage, on_bullet)
     except BadRequestError as e:
         msg = getattr(e, "message", str(e))
         raise RuntimeError(f"OpenAI BadRequest (reduce): {msg}")
@@ -185,23 +267,106 @@ def _reduce_bullets(partials: List[str], model: str = "gpt-4o-mini") -> List[str
     except Exception as e:
         raise RuntimeError(f"Reduce step failed: {str(e)}")
 
+def _format_bullets(bullets: List[str]) -> str:
+    return "\n".join(f"- {b}" for b in bullets)
+
+
+# To merge partial bullet lists level by level. Each level packs the lists into
+# batches of at most REDUCE_BATCH_TOKENS (and at least two lists), reduces the batches
+# concurrently, and feeds the results to the next level until one list is left.
+# Nothing is truncated, and every reduce request stays small.
+# on_bullet only sees the bullets of the last call, the one producing the final notes.
+def _tree_reduce(
+    partial_lists: List[str],
+    pool: ThreadPoolExecutor,
+    usage: Optional[TokenUsage] = None,
+    on_bullet: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    level = partial_lists
+    while True:
+        batches = _group_by_tokens(level, max_tokens=REDUCE_BATCH_TOKENS, sep="\n\n", min_group=2)
+        if len(batches) == 1:
+            return _reduce_bullets(batches, usage=usage, on_bullet=on_bullet)
+        reduced = list(pool.map(lambda batch: _reduce_bullets([batch], usage=usage), batches))
+        level = [_format_bullets(bullets) for bullets in reduced]
+
+
+def latency_bucket(tokens: int) -> str:
+    for limit, name in LATENCY_BUCKETS:
+        if tokens < limit:
+            return name
+    return ">24k"
+
+
 # To accepts full transcript and returns final bullets list.
-# Internally: split -> map (per chunk) -> reduce (merge).
-def generate_summary(transcript: str) -> List[str]:
+# Internally: split -> map (per chunk) -> reduce (merge, as a tree for long sermons).
+# A transcript that fits one request, or a single partial, skips the reduce entirely.
+# on_progress(stage, done, total) is called as map chunks finish and when the reduce starts.
+# on_bullet(stage, part, bullet) gets each bullet as soon as it is written: "map" bullets of
+# chunk `part` first, then the "summary" bullets of the final notes (part 0).
+# The tokens of every call are added to `usage` when given.
+def generate_summary(
+    transcript: str,
+    on_progress: Optional[Callable[[str, int, int], None]] = None,
+    fast_path: bool = SUMMARY_FAST_PATH,
+    usage: Optional[TokenUsage] = None,
+    on_bullet: Optional[Callable[[str, int, str], None]] = None,
+) -> List[str]:
     if not transcript or not transcript.strip():
         return []
 
-    chunks = _split_transcript(transcript, max_chars=3500)
-
-    # Map
-    partial_lists: List[str] = []
+    start = time.perf_counter()
+    usage = usage if usage is not None else TokenUsage()
+    tokens = count_tokens(transcript)
+    if fast_path and tokens <= SUMMARY_SINGLE_PASS_TOKENS:
+        chunks = [transcript.strip()]
+    else:
+        chunks = _chunk_transcript(transcript)
     total = len(chunks)
-    for i, chunk in enumerate(chunks, start=1):
-        partial = _summarize_chunk(chunk, part=i, total=total)
-        # Store as a clean list string for reducer
-        partial_lists.append("\n".join(f"- {p}" for p in partial))
-
-    # Reduce
-    final = _reduce_bullets(partial_lists)
-
-    return final
\ No newline at end of file
+    done = 0
+    lock = threading.Lock()
+    # A single chunk's bullets are the final notes when the reduce is skipped
+    single = fast_path and total == 1
+
+    def bullet_callback(stage: str, part: int) -> Optional[Callable[[str], None]]:
+        if on_bullet is None:
+            return None
+
+        def callback(bullet: str):
+            with lock:
+                on_bullet(stage, part, bullet)
+        return callback
+
+    def summarize(args):
+        nonlocal done
+        part, chunk = args
+        partial = _summarize_chunk(
+            chunk, part=part, total=total, usage=usage,
+            on_bullet=bullet_callback("summary", 0) if single else bullet_callback("map", part),
+        )
+        if on_progress:
+            with lock:
+                done += 1
+                on_progress("map", done, total)
+        return partial
+
+    # Map, chunks are summarized concurrently and results come back in chunk order
+    with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_MAX_CONCURRENCY, total))) as pool:
+        partials = list(pool.map(summarize, enumerate(chunks, start=1)))
+
+        if fast_path and len(partials) == 1:
+            # The one partial already covers the whole sermon
+            final = partials[0]
+        else:
+            # Store as a clean list string for reducer
+            partial_lists: List[str] = [_format_bullets(partial) for partial in partials]
+
+            # Reduce
+            if on_progress:
+                on_progress("reduce", 0, 1)
+            final = _tree_reduce(partial_lists, pool, usage, bullet_callback("summary", 0))
+
+    elapsed = time.perf_counter() - start
+    metrics.observe(f"summary_seconds[{latency_bucket(tokens)} tokens]", elapsed)
+    print(f"Summary of {tokens} tokens: {total} chunk(s) in {elapsed:.1f}s, {usage}")
+    return final
@@ -0,0 +1,40 @@
+import math
+from functools import lru_cache
+from config.pipeline import SUMMARY_MODEL
+
+# Tokens are counted with the model's own tokenizer (tiktoken). Its vocabulary file is
+# downloaded on first use (set TIKTOKEN_CACHE_DIR to ship it with the image), if it can't
+# be loaded counts fall back to the 4 chars per token heuristic.
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        print("tiktoken is not installed, token counts are estimated from characters")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # A model tiktoken doesn't know yet, the gpt-4o family encoding is the best guess
+        name = "o200k_base"
+    except Exception as e:
+        print(f"Could not load the tokenizer for {model} ({e}), token counts are estimated from characters")
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"Could not load the {name} tokenizer ({e}), token counts are estimated from characters")
+        return None
+
+
+def approx_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / 4))
+
+
+def count_tokens(text: str, model: str = SUMMARY_MODEL) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return approx_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,29 +1,39 @@
 import os
 import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import ffmpeg
+import numpy as np
+from typing import Iterator, NamedTuple, Optional, Tuple, List
 from faster_whisper import WhisperModel
+from config.pipeline import WHISPER_MODEL
+# Models are loaded lazily by the registry, on first use or at worker startup
+from utils.whisper_models import get_model, preload
+from utils.vad import SpeechMap, speech_spans
+from utils import metrics
 
-# For LOW-RAM model loader
-_MODEL = WhisperModel(
-    "tiny",
-    device="cpu",
-    compute_type="int8",
-    download_root="./models"
-)
+# Whisper expects 16 kHz mono audio
+SAMPLE_RATE = 16000
 
-# model = WhisperModel("base", device="cpu", compute_type="float32")
-
-
-def get_model() -> WhisperModel:
-    global _MODEL
-    if _MODEL is None:
-        _MODEL = WhisperModel(
-            "tiny",  # For 512MB dyno
-            device="cpu",
-            compute_type="int8"  # For massive RAM savings
-        )
-    return _MODEL
+# Streaming mode decodes through an ffmpeg pipe and transcribes one window at a time,
+# so peak memory is bounded by the window size instead of the sermon length
+STREAMING_TRANSCRIBE = os.getenv("TRANSCRIBE_STREAMING", "1") == "1"
+STREAM_WINDOW_SECONDS = float(os.getenv("TRANSCRIBE_WINDOW_SECONDS", "60"))
+# Segments ending this close to the window edge are re-transcribed with the next window
+STREAM_OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "5"))
 
+# Parallel mode, long recordings are cut at silences into pieces transcribed on all cores
+TRANSCRIBE_PARALLEL_WORKERS = int(os.getenv("TRANSCRIBE_PARALLEL_WORKERS", "1"))
+# Each job worker process (TRANSCRIBE_WORKERS in worker.py) has its own pool, so the two
+# settings multiply and every pool process holds a Whisper model. Pools are shrunk so
+# all of them together hold at most TRANSCRIBE_MAX_MODELS models (default: one per core).
+TRANSCRIBE_PROCESSES = max(1, int(os.getenv("TRANSCRIBE_WORKERS", "1")))
+TRANSCRIBE_MAX_MODELS = int(os.getenv("TRANSCRIBE_MAX_MODELS") or os.cpu_count() or 1)
+TRANSCRIBE_SEGMENT_MINUTES = float(os.getenv("TRANSCRIBE_SEGMENT_MINUTES", "5"))
+# How far back from a piece's end to look for a quiet spot to cut at
+SILENCE_SEARCH_SECONDS = float(os.getenv("TRANSCRIBE_SILENCE_SEARCH_SECONDS", "15"))
 
 # For the FFmpeg Audio conversion
 def convert_audio(input_path: str, output_path: str):
@@ -103,7 +113,388 @@ def transcribe_audio(audio_bytes: bytes, file_extension: str = ".webm") -> str:
             pass
 
 
+class TranscriptSegment(NamedTuple):
+    start: float  # seconds from the start of the recording
+    end: float
+    text: str
+
+
+# A fixed-capacity PCM buffer. Decoded samples are appended at the tail and
+# transcribed samples are released from the head, so it never grows past one window.
+class PcmBuffer:
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def free(self) -> int:
+        return len(self._data) - self._size
+
+    def write(self, samples: np.ndarray):
+        n = len(samples)
+        if n > self.free:
+            raise ValueError("PCM buffer overflow")
+        self._data[self._size:self._size + n] = samples
+        self._size += n
+
+    def view(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def consume(self, n: int):
+        n = min(n, self._size)
+        remaining = self._size - n
+        # To move the unconsumed tail (at most one window) to the front
+        self._data[:remaining] = self._data[n:self._size]
+        self._size = remaining
+
+
+# Bytes of ffmpeg's error output kept for the error message
+FFMPEG_STDERR_KEEP = 64 * 1024
+
+
+# To read ffmpeg's stderr while it runs. A damaged upload can log an error per frame,
+# left unread that fills the pipe, ffmpeg blocks and so does whoever reads its stdout.
+def drain_stderr(proc):
+    tail = bytearray()
+
+    def read():
+        while True:
+            data = proc.stderr.read1(4096)
+            if not data:
+                break
+            tail.extend(data)
+            del tail[:-FFMPEG_STDERR_KEEP]
+
+    proc.stderr_tail = tail
+    proc.stderr_reader = threading.Thread(target=read, name="ffmpeg-stderr", daemon=True)
+    proc.stderr_reader.start()
+
+
+def stderr_text(proc) -> str:
+    proc.stderr_reader.join(timeout=5)
+    return bytes(proc.stderr_tail).decode(errors="replace")
+
+
+def open_pcm_stream(input_path: str):
+    # To decode to raw 16-bit PCM on stdout instead of writing a WAV file
+    proc = (
+        ffmpeg
+        .input(input_path)
+        .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=str(SAMPLE_RATE))
+        .global_args("-loglevel", "error")
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    drain_stderr(proc)
+    return proc
+
+
+def _read_pcm(stream, max_samples: int) -> np.ndarray:
+    data = stream.read(max_samples * 2)
+    if not data:
+        return np.zeros(0, dtype=np.float32)
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+# To top the buffer up from the ffmpeg pipe, returns True once the audio is exhausted
+def _fill_buffer(buf: PcmBuffer, stream) -> bool:
+    while buf.free:
+        samples = _read_pcm(stream, buf.free)
+        if not len(samples):
+            return True
+        buf.write(samples)
+    return False
+
+
+def _finish_pcm_stream(proc):
+    proc.wait()
+    if proc.returncode != 0:
+        error_msg = stderr_text(proc) or "Unknown ffmpeg error"
+        print(" FFMPEG Conversion Error:", error_msg)
+        raise RuntimeError(f"FFMPEG failed: {error_msg}")
+
+
+def _close_pcm_stream(proc):
+    if proc.poll() is None:
+        proc.kill()
+        proc.wait()
+    proc.stderr_reader.join(timeout=5)
+    proc.stdout.close()
+    proc.stderr.close()
+
+
+def _transcribe_window(
+    model: WhisperModel,
+    audio: np.ndarray,
+    offset: float,
+    final: bool,
+    language: Optional[str] = None,
+    can_wait: bool = False,
+    vad: Optional[str] = None,
+) -> Tuple[List[TranscriptSegment], int, Optional[str]]:
+    segments = _decode(model, audio, language, vad)
+    if segments and not language:
+        language = segments[0].language
+
+    window_seconds = len(audio) / SAMPLE_RATE
+    if final:
+        committed, consumed = segments, len(audio)
+    else:
+        # To keep only segments that end safely before the window edge, the rest
+        # (often a word cut in half) is transcribed again with the next window
+        cutoff = window_seconds - STREAM_OVERLAP_SECONDS
+        committed = [s for s in segments if s.end <= cutoff]
+        if committed:
+            consumed = int(committed[-1].end * SAMPLE_RATE)
+        elif segments and can_wait:
+            # The window isn't full yet (live audio), wait for more before committing
+            consumed = 0
+        elif segments:
+            # One segment spans the whole window, accept it rather than loop forever
+            committed, consumed = segments, len(audio)
+        else:
+            consumed = len(audio) - int(STREAM_OVERLAP_SECONDS * SAMPLE_RATE)
+        consumed = max(0 if can_wait else 1, min(consumed, len(audio)))
+
+    result = [
+        TranscriptSegment(offset + s.start, offset + s.end, s.text.strip())
+        for s in committed
+    ]
+    return result, consumed, language
+
+
+class _Decoded(NamedTuple):
+    start: float  # seconds from the start of the window
+    end: float
+    text: str
+    language: Optional[str]
+
+
+# To run Whisper on a window, with the optional VAD pre-pass (TRANSCRIBE_VAD): only the
+# speech spans are decoded and the segment times are mapped back onto the window.
+def _decode(model: WhisperModel, audio: np.ndarray, language: Optional[str], vad: Optional[str]) -> List[_Decoded]:
+    spans = speech_spans(audio, vad)
+    speech_map = None
+    if spans is not None:
+        speech_map = SpeechMap(spans)
+        metrics.inc("vad_audio_seconds", len(audio) / SAMPLE_RATE)
+        metrics.inc("vad_skipped_seconds", (len(audio) - speech_map.speech_samples) / SAMPLE_RATE)
+        if not spans:
+            return []
+        audio = speech_map.trim(audio)
+
+    segments, info = model.transcribe(
+        audio,
+        language=language,
+        beam_size=1,  # To disable beam search less RAM
+        best_of=1,
+        vad_filter=False,  # For lower RAM/CPU, the pre-pass above is cheaper
+        chunk_length=15,  # To process in small chunks
+        temperature=0.0
+    )
+    decoded = []
+    for s in segments:
+        if not s.text.strip():
+            continue
+        start, end = s.start, s.end
+        if speech_map:
+            start, end = speech_map.original_time(start), speech_map.original_time(end, is_end=True)
+        decoded.append(_Decoded(start, end, s.text, language or info.language))
+    return decoded
+
+
+# Yields transcript segments (with timestamps relative to the whole recording) as the
+# audio is decoded. Only one window of PCM is held in memory at any time.
+def iter_segments(
+    input_path: str,
+    model: Optional[WhisperModel] = None,
+    vad: Optional[str] = None,
+) -> Iterator[TranscriptSegment]:
+    model = model or get_model()
+    buf = PcmBuffer(int(STREAM_WINDOW_SECONDS * SAMPLE_RATE))
+    offset_samples = 0
+    language = None
+    eof = False
+
+    proc = open_pcm_stream(input_path)
+    try:
+        while True:
+            if not eof:
+                eof = _fill_buffer(buf, proc.stdout)
+            if not len(buf):
+                break
+
+            segments, consumed, language = _transcribe_window(
+                model, buf.view(), offset_samples / SAMPLE_RATE, final=eof, language=language, vad=vad,
+            )
+            yield from segments
+            buf.consume(consumed)
+            offset_samples += consumed
+
+        _finish_pcm_stream(proc)
+    finally:
+        _close_pcm_stream(proc)
+
+
+# To find a quiet spot to cut at, the 30 ms frame with the lowest energy
+# within the last `search_seconds` of the audio. Returns a sample index.
+def _find_silence(audio: np.ndarray, search_seconds: float = SILENCE_SEARCH_SECONDS) -> int:
+    frame = int(0.03 * SAMPLE_RATE)
+    start = max(0, len(audio) - int(search_seconds * SAMPLE_RATE))
+    tail = audio[start:]
+    n_frames = len(tail) // frame
+    if n_frames < 2:
+        return len(audio)
+    energy = np.square(tail[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    return start + int(np.argmin(energy)) * frame + frame // 2
+
+
+# Yields (offset_seconds, audio) pieces of about `segment_seconds`, cut at silence
+# so that no word is split between two pieces.
+def iter_audio_segments(input_path: str, segment_seconds: float) -> Iterator[Tuple[float, np.ndarray]]:
+    buf = PcmBuffer(int(segment_seconds * SAMPLE_RATE))
+    offset_samples = 0
+    eof = False
+
+    proc = open_pcm_stream(input_path)
+    try:
+        while True:
+            if not eof:
+                eof = _fill_buffer(buf, proc.stdout)
+            if not len(buf):
+                break
+
+            audio = buf.view()
+            cut = len(audio) if eof else _find_silence(audio)
+            yield offset_samples / SAMPLE_RATE, audio[:cut].copy()
+            buf.consume(cut)
+            offset_samples += cut
+
+        _finish_pcm_stream(proc)
+    finally:
+        _close_pcm_stream(proc)
+
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+
+
+def _init_pool_worker(cpu_threads: int):
+    # Each pool process holds its own model, sized to its share of the cores
+    preload([WHISPER_MODEL], cpu_threads=cpu_threads)
+
+
+def _transcribe_piece(audio: np.ndarray, offset: float) -> List[TranscriptSegment]:
+    segments, _, _ = _transcribe_window(get_model(), audio, offset, final=True)
+    return segments
+
+
+# Pool size per job worker process, TRANSCRIBE_PARALLEL_WORKERS within the model cap
+def parallel_workers() -> int:
+    return max(1, min(TRANSCRIBE_PARALLEL_WORKERS, TRANSCRIBE_MAX_MODELS // TRANSCRIBE_PROCESSES))
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL, _POOL_WORKERS
+    if _POOL is None or _POOL_WORKERS != workers:
+        if _POOL is not None:
+            _POOL.shutdown()
+        if workers < TRANSCRIBE_PARALLEL_WORKERS:
+            print(
+                f"TRANSCRIBE_PARALLEL_WORKERS={TRANSCRIBE_PARALLEL_WORKERS} x TRANSCRIBE_WORKERS={TRANSCRIBE_PROCESSES} "
+                f"is over TRANSCRIBE_MAX_MODELS={TRANSCRIBE_MAX_MODELS}, using {workers} pool processes per worker"
+            )
+        # The cores are shared by the pools of every job worker process
+        cpu_threads = max(1, (os.cpu_count() or 1) // (workers * TRANSCRIBE_PROCESSES))
+        # spawn (not fork) so children never share the parent's CTranslate2 state
+        _POOL = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_pool_worker,
+            initargs=(cpu_threads,),
+        )
+        _POOL_WORKERS = workers
+    return _POOL
+
+
+# To stop the pool processes right away, for a worker giving up on a stuck job
+def kill_pool():
+    global _POOL
+    if _POOL is None:
+        return
+    for proc in list(_POOL._processes.values()):
+        proc.kill()
+    _POOL.shutdown(wait=False, cancel_futures=True)
+    _POOL = None
+
+
+# Splits the recording at silences into TRANSCRIBE_SEGMENT_MINUTES pieces and transcribes
+# them in a process pool. Results are yielded in recording order, and at most two pieces
+# per worker are decoded ahead so memory stays bounded.
+def iter_segments_parallel(
+    input_path: str,
+    workers: Optional[int] = None,
+    segment_minutes: Optional[float] = None,
+) -> Iterator[TranscriptSegment]:
+    workers = workers or parallel_workers()
+    segment_seconds = (segment_minutes or TRANSCRIBE_SEGMENT_MINUTES) * 60
+    pool = _get_pool(workers)
+
+    pending = deque()
+    for offset, audio in iter_audio_segments(input_path, segment_seconds):
+        pending.append(pool.submit(_transcribe_piece, audio, offset))
+        if len(pending) >= workers * 2:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+# The non-streaming path, the upload is converted to a temp WAV that Whisper reads
+def iter_wav_segments(input_path: str) -> Iterator[TranscriptSegment]:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as wav_file:
+        wav_path = wav_file.name
+    try:
+        convert_audio(input_path, wav_path)
+        segments, _ = get_model().transcribe(
+            wav_path,
+            beam_size=1,
+            best_of=1,
+            vad_filter=False,
+            chunk_length=15,
+            temperature=0.0
+        )
+        for segment in segments:
+            if segment.text.strip():
+                yield TranscriptSegment(segment.start, segment.end, segment.text.strip())
+    finally:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+
+
+# Transcript segments of a file as they are produced, in whichever mode is configured
+def transcribe_segments(path: str) -> Iterator[TranscriptSegment]:
+    if parallel_workers() > 1:
+        return iter_segments_parallel(path)
+    if STREAMING_TRANSCRIBE:
+        return iter_segments(path)
+    return iter_wav_segments(path)
+
+
+def transcribe_stream(path: str) -> str:
+    parts = []
+    for segment in transcribe_segments(path):
+        print(f"[{segment.start:.2f}s - {segment.end:.2f}s] {segment.text}")
+        parts.append(segment.text)
+    return " ".join(parts).strip()
+
+
 def transcribe_file(path: str) -> str:
+    if STREAMING_TRANSCRIBE or parallel_workers() > 1:
+        # To decode straight from the upload, no WAV copy and no bytes in RAM
+        return transcribe_stream(path)
+
     # Get file extension from path for better format detection
     _, ext = os.path.splitext(path)
     ext = ext if ext else ".webm"  # Default to .webm for browser recordings
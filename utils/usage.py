@@ -0,0 +1,260 @@
+import math
+import os
+import atexit
+import json
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from config.db import engine
+from models.usage_record import UsageRecord
+from models.user_subscriptions import UserSubscription, SubscriptionStatus
+from models.subscription_plans import SubscriptionPlan
+from utils import metrics
+
+load_dotenv()
+
+# Per-user plan limits are cached this long, they change rarely and are read on every upload
+PLAN_CACHE_SECONDS = float(os.getenv("PLAN_CACHE_SECONDS", "300"))
+# Plan used for users without an active subscription
+FREE_PLAN_SLUG = os.getenv("FREE_PLAN_SLUG", "free")
+# Usage increments are buffered and written in one UPSERT at most this often
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+# Increments the database refuses for good are appended here (JSON lines) to be replayed by hand
+USAGE_DEAD_LETTER_PATH = os.getenv("USAGE_DEAD_LETTER_PATH") or os.path.join(
+    tempfile.gettempdir(), "gospelnote-usage-dead-letter.jsonl"
+)
+
+
+class PlanLimits(NamedTuple):
+    subscription_id: Optional[int]
+    count_limit: int  # transcriptions per month, 0 means unlimited
+    time_limit: int  # seconds of audio per month, 0 means unlimited
+
+
+class Usage(NamedTuple):
+    count: int
+    seconds: int
+
+
+# To bring an existing usage_records table in line with the model: subscription_id
+# became nullable (free plan users have no subscription), older tables still have NOT NULL
+def migrate_usage_table():
+    table = UsageRecord.__table__
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        return
+    columns = {c["name"]: c for c in inspector.get_columns(table.name)}
+    column = columns.get("subscription_id")
+    if column is None or column["nullable"]:
+        return
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN subscription_id DROP NOT NULL"))
+        print("usage_records.subscription_id is now nullable")
+    else:
+        print(f"usage_records.subscription_id is NOT NULL, free plan usage can't be stored on {engine.dialect.name}")
+
+
+def usage_month(day: Optional[date] = None) -> date:
+    return (day or datetime.utcnow().date()).replace(day=1)
+
+
+_plan_cache: Dict[int, Tuple[float, PlanLimits]] = {}
+_plan_lock = threading.Lock()
+
+
+def _load_plan(user_id: int) -> PlanLimits:
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        row = session.exec(
+            select(UserSubscription.id, SubscriptionPlan.transcription_count_limit, SubscriptionPlan.transcription_time_limit)
+            .join(SubscriptionPlan, SubscriptionPlan.id == UserSubscription.plan_id)
+            .where(
+                UserSubscription.user_id == user_id,
+                UserSubscription.status.in_([SubscriptionStatus.ACTIVE, SubscriptionStatus.TRIALING]),
+                UserSubscription.current_period_end > now,
+            )
+            .order_by(UserSubscription.current_period_end.desc())
+        ).first()
+        if row:
+            return PlanLimits(*row)
+
+        free = session.exec(
+            select(SubscriptionPlan.transcription_count_limit, SubscriptionPlan.transcription_time_limit)
+            .where(SubscriptionPlan.slug == FREE_PLAN_SLUG, SubscriptionPlan.is_active)
+        ).first()
+        if free:
+            return PlanLimits(None, *free)
+    return PlanLimits(None, 0, 0)
+
+
+def get_plan_limits(user_id: int) -> PlanLimits:
+    with _plan_lock:
+        cached = _plan_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    limits = _load_plan(user_id)
+    with _plan_lock:
+        _plan_cache[user_id] = (time.monotonic() + PLAN_CACHE_SECONDS, limits)
+    return limits
+
+
+# To drop a user's cached plan, e.g. after a subscription change
+def invalidate_plan(user_id: int):
+    with _plan_lock:
+        _plan_cache.pop(user_id, None)
+
+
+def get_usage(user_id: int, month: Optional[date] = None) -> Usage:
+    with Session(engine) as session:
+        row = session.exec(
+            select(UsageRecord.transcription_count, UsageRecord.transcription_duration_seconds)
+            .where(UsageRecord.user_id == user_id, UsageRecord.usage_month == (month or usage_month()))
+        ).first()
+    return Usage(*row) if row else Usage(0, 0)
+
+
+# Returns why the user can't transcribe `pending` more (count, seconds) this month, or None.
+# `pending` covers their jobs that are queued or running and not metered yet.
+def quota_error(user_id: int, seconds: float = 0, pending: Usage = Usage(0, 0)) -> Optional[str]:
+    limits = get_plan_limits(user_id)
+    if not limits.count_limit and not limits.time_limit:
+        return None
+    used = get_usage(user_id)
+    if limits.count_limit and used.count + pending.count + 1 > limits.count_limit:
+        return f"Monthly limit of {limits.count_limit} transcriptions reached"
+    if limits.time_limit and used.seconds + pending.seconds + seconds > limits.time_limit:
+        return f"Monthly limit of {limits.time_limit // 60} minutes of audio reached"
+    return None
+
+
+# Seconds of audio the user may still transcribe this month, None when the plan has no
+# time limit. `pending` as for quota_error.
+def seconds_left(user_id: int, pending: Usage = Usage(0, 0)) -> Optional[float]:
+    limits = get_plan_limits(user_id)
+    if not limits.time_limit:
+        return None
+    return max(0, limits.time_limit - get_usage(user_id).seconds - pending.seconds)
+
+
+# To add to (user, month) counters with one atomic INSERT .. ON CONFLICT DO UPDATE per
+# batch, on the unique_user_month constraint. No read-modify-write, so concurrent
+# writers never lose an increment.
+def upsert_usage(increments: Dict[Tuple[int, date], Tuple[int, int, Optional[int]]]):
+    if not increments:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "usage_month": month,
+            "subscription_id": subscription_id,
+            "transcription_count": count,
+            "transcription_duration_seconds": seconds,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for (user_id, month), (count, seconds, subscription_id) in sorted(increments.items())
+    ]
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    table = UsageRecord.__table__
+    stmt = dialect.insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.usage_month],
+        set_={
+            "transcription_count": table.c.transcription_count + stmt.excluded.transcription_count,
+            "transcription_duration_seconds":
+                table.c.transcription_duration_seconds + stmt.excluded.transcription_duration_seconds,
+            "subscription_id": func.coalesce(stmt.excluded.subscription_id, table.c.subscription_id),
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt)
+
+
+# Buffered increments, flushed together so a burst of finished jobs is one write
+_pending: Dict[Tuple[int, date], list] = {}
+_pending_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+
+
+def record_usage(user_id: Optional[int], duration_seconds: Optional[float]):
+    global _flusher
+    if not user_id:
+        return
+    key = (user_id, usage_month())
+    seconds = math.ceil(duration_seconds or 0)
+    try:
+        subscription_id = get_plan_limits(user_id).subscription_id
+    except Exception:
+        # Metering must not fail a finished job, the subscription is filled in on a later flush
+        subscription_id = None
+    with _pending_lock:
+        entry = _pending.setdefault(key, [0, 0, subscription_id])
+        entry[0] += 1
+        entry[1] += seconds
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, name="usage-flusher", daemon=True)
+            _flusher.start()
+
+
+def _requeue(key: Tuple[int, date], count: int, seconds: int, subscription_id: Optional[int]):
+    with _pending_lock:
+        entry = _pending.setdefault(key, [0, 0, subscription_id])
+        entry[0] += count
+        entry[1] += seconds
+
+
+def _dead_letter(key: Tuple[int, date], value: list, error: Exception):
+    metrics.inc("usage_dead_lettered")
+    print(f"Usage increment for user {key[0]} refused by the database, written to {USAGE_DEAD_LETTER_PATH}: {error}")
+    try:
+        with open(USAGE_DEAD_LETTER_PATH, "a") as f:
+            f.write(json.dumps({
+                "user_id": key[0], "usage_month": key[1].isoformat(),
+                "count": value[0], "seconds": value[1], "subscription_id": value[2],
+                "error": str(error).splitlines()[0],
+            }) + "\n")
+    except OSError as e:
+        print(f"Could not write the usage dead letter file: {e}")
+
+
+def flush_usage():
+    global _pending
+    with _pending_lock:
+        batch, _pending = _pending, {}
+    if not batch:
+        return
+    try:
+        upsert_usage({key: tuple(value) for key, value in batch.items()})
+        return
+    except Exception as e:
+        print(f"Usage flush failed, retrying row by row: {e}")
+
+    # One row the database refuses must not hold back everyone else's metering. Rows
+    # refused for good (constraint/data errors) are dead-lettered, the rest (e.g. the
+    # database being down) are kept for the next flush.
+    for key, value in batch.items():
+        try:
+            upsert_usage({key: tuple(value)})
+        except (IntegrityError, DataError) as e:
+            _dead_letter(key, value, e)
+        except Exception:
+            _requeue(key, *value)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(USAGE_FLUSH_SECONDS)
+        flush_usage()
+
+
+atexit.register(flush_usage)
@@ -0,0 +1,102 @@
+import os
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from config.pipeline import TRANSCRIBE_VAD
+
+load_dotenv()
+
+# Voice activity pre-pass (TRANSCRIBE_VAD), non-speech (music, long pauses, dead air) is
+# cut out of the audio before Whisper decodes it. "energy" is a cheap NumPy loudness gate,
+# "silero" runs the Silero VAD model bundled with faster-whisper (onnxruntime), "off"
+# keeps all audio.
+# Only silences at least this long are removed, shorter pauses are part of speech
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "1.0"))
+# Audio kept on each side of a speech span so word edges are never clipped
+VAD_SPEECH_PAD_SECONDS = float(os.getenv("VAD_SPEECH_PAD_SECONDS", "0.3"))
+# Energy gate: a 30 ms frame is speech when it is this many dB above the noise floor
+VAD_ENERGY_MARGIN_DB = float(os.getenv("VAD_ENERGY_MARGIN_DB", "15"))
+# and never when quieter than this (dBFS), so near-silent recordings aren't all speech
+VAD_ENERGY_FLOOR_DB = float(os.getenv("VAD_ENERGY_FLOOR_DB", "-55"))
+
+SAMPLE_RATE = 16000
+_FRAME = int(0.03 * SAMPLE_RATE)
+
+
+def _merge_spans(spans: List[Tuple[int, int]], n_samples: int, pad: bool = True) -> List[Tuple[int, int]]:
+    pad = int(VAD_SPEECH_PAD_SECONDS * SAMPLE_RATE) if pad else 0
+    min_gap = int(VAD_MIN_SILENCE_SECONDS * SAMPLE_RATE)
+    merged: List[Tuple[int, int]] = []
+    for start, end in spans:
+        start, end = max(0, start - pad), min(n_samples, end + pad)
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def energy_speech_spans(audio: np.ndarray) -> List[Tuple[int, int]]:
+    n_frames = len(audio) // _FRAME
+    if n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+    frames = audio[:n_frames * _FRAME].reshape(n_frames, _FRAME)
+    db = 10 * np.log10(np.square(frames).mean(axis=1) + 1e-10)
+
+    # The quietest frames of the window give the noise floor
+    threshold = max(np.percentile(db, 10) + VAD_ENERGY_MARGIN_DB, VAD_ENERGY_FLOOR_DB)
+    speech = np.concatenate(([False], db > threshold, [False]))
+    edges = np.flatnonzero(np.diff(speech.astype(np.int8)))
+    spans = [(int(s) * _FRAME, int(e) * _FRAME) for s, e in zip(edges[::2], edges[1::2])]
+    # The leftover partial frame follows the last full one
+    if spans and spans[-1][1] == n_frames * _FRAME:
+        spans[-1] = (spans[-1][0], len(audio))
+    return _merge_spans(spans, len(audio))
+
+
+def silero_speech_spans(audio: np.ndarray) -> List[Tuple[int, int]]:
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    options = VadOptions(
+        min_silence_duration_ms=int(VAD_MIN_SILENCE_SECONDS * 1000),
+        speech_pad_ms=int(VAD_SPEECH_PAD_SECONDS * 1000),
+    )
+    spans = [(ts["start"], ts["end"]) for ts in get_speech_timestamps(audio, options)]
+    # Silero already padded the spans
+    return _merge_spans(spans, len(audio), pad=False)
+
+
+def speech_spans(audio: np.ndarray, mode: Optional[str] = None) -> Optional[List[Tuple[int, int]]]:
+    mode = (mode or TRANSCRIBE_VAD).lower()
+    if mode == "energy":
+        return energy_speech_spans(audio)
+    if mode == "silero":
+        return silero_speech_spans(audio)
+    return None
+
+
+# Maps times in the trimmed audio (speech spans glued together) back to the original
+class SpeechMap:
+    def __init__(self, spans: List[Tuple[int, int]]):
+        self.spans = spans
+        self._ends: List[int] = []  # end of each span on the trimmed timeline, in samples
+        total = 0
+        for start, end in spans:
+            total += end - start
+            self._ends.append(total)
+
+    @property
+    def speech_samples(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    def trim(self, audio: np.ndarray) -> np.ndarray:
+        return np.concatenate([audio[start:end] for start, end in self.spans])
+
+    def original_time(self, seconds: float, is_end: bool = False) -> float:
+        sample = min(int(round(seconds * SAMPLE_RATE)), self.speech_samples)
+        # On the boundary between two spans, an end belongs to the earlier span, a start to the later
+        find = bisect_left if is_end else bisect_right
+        i = min(find(self._ends, sample), len(self.spans) - 1)
+        span_start = self._ends[i - 1] if i else 0
+        return (self.spans[i][0] + sample - span_start) / SAMPLE_RATE
@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from config.pipeline import (
+    WHISPER_MODEL, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, WHISPER_CPU_THREADS,
+    WHISPER_NUM_WORKERS, WHISPER_DOWNLOAD_ROOT, WHISPER_IDLE_SECONDS,
+)
+
+# Loaded Whisper models by name, e.g. "tiny" for quick drafts and "small" for final
+# notes. Nothing is loaded at import, so API processes that never transcribe don't
+# pay the load time or the RAM.
+_MODELS: Dict[str, "WhisperModel"] = {}
+_LAST_USED: Dict[str, float] = {}
+_LOCK = threading.Lock()
+_reaper: Optional[threading.Thread] = None
+
+
+def _load(name: str, cpu_threads: Optional[int] = None):
+    from faster_whisper import WhisperModel
+
+    started = time.perf_counter()
+    model = WhisperModel(
+        name,
+        device=WHISPER_DEVICE,
+        compute_type=WHISPER_COMPUTE_TYPE,
+        cpu_threads=cpu_threads if cpu_threads is not None else WHISPER_CPU_THREADS,
+        num_workers=WHISPER_NUM_WORKERS,
+        download_root=WHISPER_DOWNLOAD_ROOT,
+    )
+    print(f"Loaded Whisper model '{name}' in {time.perf_counter() - started:.1f}s")
+    return model
+
+
+def get_model(name: Optional[str] = None, cpu_threads: Optional[int] = None):
+    name = name or WHISPER_MODEL
+    with _LOCK:
+        model = _MODELS.get(name)
+        if model is None:
+            model = _MODELS[name] = _load(name, cpu_threads)
+        _LAST_USED[name] = time.monotonic()
+    _start_reaper()
+    return model
+
+
+def preload(names: Iterable[str], cpu_threads: Optional[int] = None):
+    for name in names:
+        get_model(name, cpu_threads)
+
+
+def loaded_models() -> List[str]:
+    with _LOCK:
+        return list(_MODELS)
+
+
+# To drop models nobody asked for in `max_idle` seconds. A transcription that is still
+# running keeps its own reference, so the memory is released once it finishes.
+def evict_idle(max_idle: float = WHISPER_IDLE_SECONDS) -> List[str]:
+    now = time.monotonic()
+    with _LOCK:
+        idle = [name for name, used in _LAST_USED.items() if now - used > max_idle]
+        for name in idle:
+            _MODELS.pop(name, None)
+            _LAST_USED.pop(name, None)
+    for name in idle:
+        print(f"Unloaded idle Whisper model '{name}'")
+    return idle
+
+
+def _reap_forever():
+    while True:
+        time.sleep(max(5, WHISPER_IDLE_SECONDS / 4))
+        evict_idle()
+
+
+def _start_reaper():
+    global _reaper
+    if WHISPER_IDLE_SECONDS <= 0 or _reaper is not None:
+        return
+    with _LOCK:
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_forever, name="whisper-reaper", daemon=True)
+            _reaper.start()
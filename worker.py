@@ -0,0 +1,254 @@
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+import multiprocessing
+from typing import Dict, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.job_queue import (
+    create_job_table, claim_next_job, complete_job, fail_job, requeue_stale_jobs, update_job_progress,
+    heartbeat_job, worker_seen, worker_gone, TRANSCRIBE_WORKERS, JOB_HEARTBEAT_SECONDS, JOB_TIMEOUT_SECONDS,
+    job_engine,
+)
+from utils.result_cache import get_cached_result, put_cached_result
+from utils.usage import record_usage, flush_usage, migrate_usage_table
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+STALE_CHECK_INTERVAL = float(os.getenv("JOB_STALE_CHECK_INTERVAL", "60"))
+# Minimum seconds between progress writes while a stage is running
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "2"))
+
+
+def _merge_references(*groups) -> list:
+    merged, seen = [], set()
+    for group in groups:
+        for ref in group:
+            if ref not in seen:
+                seen.add(ref)
+                merged.append(ref)
+    return merged
+
+
+def process_job(
+    job_id: str,
+    worker_id: str,
+    tmp_path: str,
+    audio_hash: str = None,
+    duration: float = None,
+    user_id: int = None,
+):
+    # Heavy imports stay inside the worker so the API processes never load Whisper
+    from utils.transcribe import transcribe_segments, kill_pool
+    from utils.audio_info import probe_duration
+    from utils.summarize import generate_summary
+    from utils.llm import TokenUsage
+    from utils.extract_bible import detect_bible_verses
+    from utils.bible_refs import StreamingReferenceDetector
+
+    last_report = 0.0
+
+    # To publish progress, throttled so long stages don't write on every segment
+    def report(force: bool = False, **progress):
+        nonlocal last_report
+        if force or time.monotonic() - last_report >= JOB_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            update_job_progress(job_id, worker_id, progress)
+
+    # Bullets streamed so far, by chunk (part 0 holds the final notes once they start)
+    notes: Dict[int, List[str]] = {}
+    summary_progress = {"stage": "summarizing", "chunks_done": 0}
+
+    def preview() -> List[str]:
+        if 0 in notes:
+            return list(notes[0])
+        return [bullet for part in sorted(notes) for bullet in notes[part]]
+
+    def report_summary(stage: str, done: int, total: int):
+        if stage == "map":
+            summary_progress.update(chunks_done=done, chunks_total=total)
+        else:
+            summary_progress["stage"] = "reducing"
+        report(force=stage != "map" or done == total, **summary_progress, notes=preview())
+
+    def report_bullet(stage: str, part: int, bullet: str):
+        # The first note, and the first of the final notes, are published right away
+        first = not notes or (part == 0 and 0 not in notes)
+        notes.setdefault(part, []).append(bullet)
+        report(force=first, **summary_progress, notes=preview())
+
+    # To keep the job marked alive through stages that report no progress for a while
+    done = threading.Event()
+
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+
+    def heartbeat():
+        while not done.wait(min(JOB_HEARTBEAT_SECONDS, JOB_TIMEOUT_SECONDS)):
+            if time.monotonic() > deadline:
+                # The job thread can't be interrupted, so the whole worker process goes
+                print(f"Job {job_id} still running after {JOB_TIMEOUT_SECONDS:.0f}s, failing it and restarting {worker_id}")
+                try:
+                    fail_job(job_id, worker_id, f"Job timed out after {JOB_TIMEOUT_SECONDS:.0f}s", "")
+                    flush_usage()
+                finally:
+                    kill_pool()
+                    os._exit(1)
+            try:
+                # The polling loop doesn't run during a job, the API must still see this worker
+                worker_seen(worker_id)
+                if not heartbeat_job(job_id, worker_id):
+                    print(f"Worker {worker_id} no longer owns job {job_id}, its result will be dropped")
+                    return
+            except Exception as e:
+                print(f"Heartbeat for job {job_id} failed: {e}")
+
+    threading.Thread(target=heartbeat, name=f"heartbeat-{job_id}", daemon=True).start()
+
+    try:
+        # An identical upload may have finished while this one was queued
+        cached = get_cached_result(audio_hash)
+        if cached is not None:
+            if complete_job(job_id, worker_id, cached):
+                record_usage(user_id, duration)
+            return
+
+        # To transcribe, scanning every segment for bible verses as Whisper produces it
+        duration = duration or probe_duration(tmp_path)
+        report(force=True, stage="transcribing", percent=0.0, duration_seconds=duration)
+        detector = StreamingReferenceDetector()
+        parts = []
+        for segment in transcribe_segments(tmp_path):
+            parts.append(segment.text)
+            detector.feed(segment.text, segment.start, segment.end)
+            if duration:
+                report(
+                    stage="transcribing",
+                    percent=round(min(100.0, segment.end / duration * 100), 1),
+                    duration_seconds=duration,
+                )
+        transcript = " ".join(parts).strip()
+        transcript_refs = detector.finish()
+        # Metered on the probed length, or on the transcript's end when it couldn't be probed
+        duration = duration or (segment.end if parts else 0)
+
+        # To summarize, then add verses the notes mention that weren't heard in the transcript
+        report(force=True, **summary_progress)
+        usage = TokenUsage()
+        summary = generate_summary(transcript, on_progress=report_summary, usage=usage, on_bullet=report_bullet)
+        print(f"Job {job_id} LLM usage: {usage}")
+        bible_refs = _merge_references(
+            [ref["reference"] for ref in transcript_refs],
+            detect_bible_verses(" ".join(summary)),
+        )
+        result = {
+            "transcript": transcript,
+            "summary": summary,
+            "bible_references": bible_refs,
+            "bible_reference_timestamps": transcript_refs,
+        }
+        # Only the worker that still owns the job meters it, a requeued copy is charged once
+        if complete_job(job_id, worker_id, result):
+            record_usage(user_id, duration)
+        put_cached_result(audio_hash, result)
+
+    except Exception as e:
+        # To record the error on the job instead of killing the worker
+        fail_job(job_id, worker_id, str(e), traceback.format_exc())
+    finally:
+        done.set()
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except Exception:
+            pass
+
+
+def run_worker(index: int):
+    # The forked child inherits the supervisor's pooled connections, drop them (without
+    # closing the parent's sockets) so this process opens its own
+    from config.db import engine
+    job_engine.dispose(close=False)
+    engine.dispose(close=False)
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    stopping = False
+
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    # To finish the current job on shutdown instead of dropping it halfway
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    # To load the model before the first job rather than during it
+    from utils.whisper_models import preload
+    from config.pipeline import WHISPER_MODEL, WHISPER_PRELOAD
+    preload(WHISPER_PRELOAD or [WHISPER_MODEL])
+
+    print(f"Transcription worker {worker_id} started")
+    last_seen = 0.0
+    while not stopping:
+        # To let the API know a worker is there to pick up uploads
+        if time.monotonic() - last_seen >= JOB_HEARTBEAT_SECONDS / 2:
+            worker_seen(worker_id)
+            last_seen = time.monotonic()
+        job = claim_next_job(worker_id)
+        if job is None:
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        print(f"Worker {worker_id} processing job {job.id}")
+        process_job(job.id, worker_id, job.file_path, job.audio_hash, job.duration_seconds, job.user_id)
+    flush_usage()
+    worker_gone(worker_id)
+    print(f"Transcription worker {worker_id} stopped")
+
+
+def main():
+    create_job_table()
+    migrate_usage_table()
+    requeue_stale_jobs()
+
+    def _spawn(index: int) -> multiprocessing.Process:
+        proc = multiprocessing.Process(target=run_worker, args=(index,), name=f"transcribe-{index}")
+        proc.start()
+        return proc
+
+    procs = [_spawn(i) for i in range(TRANSCRIBE_WORKERS)]
+    stopping = False
+
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    # To supervise the pool, restart crashed workers and recover their jobs
+    last_stale_check = time.monotonic()
+    while not stopping:
+        for i, proc in enumerate(procs):
+            if not proc.is_alive() and not stopping:
+                print(f"Worker {proc.name} exited with code {proc.exitcode}, restarting")
+                procs[i] = _spawn(i)
+        if time.monotonic() - last_stale_check > STALE_CHECK_INTERVAL:
+            try:
+                requeue_stale_jobs()
+            except Exception as e:
+                print(f"Stale job check failed: {e}")
+            last_stale_check = time.monotonic()
+        time.sleep(1)
+
+    for proc in procs:
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()